@@ -0,0 +1,397 @@
+# coding: utf-8
+"""
+Benchmarks for python-gegl
+
+Measures the overhead of the wrapper hot paths, each next to the
+same work done with raw gobject introspection (as in "snippets.py"),
+and a few complete pipelines. Images are generated, so no
+data files or network access are needed.
+
+Usage:
+    python benchmarks/run.py [-o results.json] [-k filter]
+                             [--compare previous.json]
+
+Results are saved as JSON, so the numbers from different versions
+can be compared with --compare.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gegl
+
+G = gegl.gegl._gegl
+
+CASES = []
+
+def case(name, baseline=None, number=1000):
+    """Registers a benchmark. The decorated function does any needed
+    setup and returns the callable to be timed.
+    """
+    def decorator(func):
+        CASES.append((name, func, baseline, number))
+        return func
+    return decorator
+
+def raw_node(operation, parent=None, **props):
+    node = G.Node()
+    node.set_property("operation", operation)
+    for key, value in props.items():
+        node.set_property(key, value)
+    if parent is not None:
+        parent.add_child(node)
+    return node
+
+
+# Import time - run in fresh interpreters
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def python_run(code):
+    return lambda: subprocess.check_call([sys.executable, "-c", code],
+                                         cwd=ROOT)
+
+@case("raw-import", number=3)
+def raw_import():
+    return python_run("import gi; gi.require_version('Gegl', '0.4'); "
+                      "from gi.repository import Gegl; Gegl.init([])")
+
+@case("import", baseline="raw-import", number=3)
+def import_():
+    return python_run("import gegl")
+
+@case("import-and-first-node", baseline="raw-import", number=3)
+def import_and_first_node():
+    return python_run("import gegl; gegl.OpNode('nop')")
+
+
+# OpNode construction and properties
+
+@case("raw-node-new")
+def raw_node_new():
+    return lambda: raw_node("gegl:gaussian-blur")
+
+@case("opnode-new", baseline="raw-node-new")
+def opnode_new():
+    return lambda: gegl.OpNode("gaussian-blur")
+
+@case("raw-property-set", number=20000)
+def raw_property_set():
+    node = raw_node("gegl:gaussian-blur")
+    return lambda: node.set_property("std-dev-x", 2.0)
+
+@case("opnode-property-set", baseline="raw-property-set", number=20000)
+def opnode_property_set():
+    node = gegl.OpNode("gaussian-blur")
+    def run():
+        node.std_dev_x = 2.0
+    return run
+
+@case("raw-property-get", number=20000)
+def raw_property_get():
+    node = raw_node("gegl:gaussian-blur")
+    return lambda: node.get_property("std-dev-x")
+
+@case("opnode-property-get", baseline="raw-property-get", number=20000)
+def opnode_property_get():
+    node = gegl.OpNode("gaussian-blur")
+    return lambda: node.std_dev_x
+
+@case("raw-color-property-set", number=5000)
+def raw_color_property_set():
+    node = raw_node("gegl:color")
+    def run():
+        color = G.Color()
+        color.set_rgba(1, 0.5, 0, 1)
+        node.set_property("value", color)
+    return run
+
+@case("opnode-color-property-set", baseline="raw-color-property-set",
+      number=5000)
+def opnode_color_property_set():
+    node = gegl.OpNode("color")
+    def run():
+        node.value = (1, 0.5, 0, 1)
+    return run
+
+@case("raw-multi-property-set", number=5000)
+def raw_multi_property_set():
+    node = raw_node("gegl:grid")
+    def run():
+        for key, value in (("x", 16), ("y", 16), ("offset-x", 2),
+                           ("offset-y", 2), ("line-width", 2),
+                           ("line-height", 2)):
+            node.set_property(key, value)
+    return run
+
+@case("opnode-multi-property-set", baseline="raw-multi-property-set",
+      number=5000)
+def opnode_multi_property_set():
+    node = gegl.OpNode("grid")
+    return lambda: node.set(x=16, y=16, offset_x=2, offset_y=2,
+                            line_width=2, line_height=2)
+
+
+# Graph manipulation on long chains
+
+CHAIN = 200
+
+@case("raw-chain-build", number=20)
+def raw_chain_build():
+    def run():
+        graph = G.Node()
+        previous = None
+        for i in range(CHAIN):
+            node = raw_node("gegl:nop", graph)
+            if previous is not None:
+                previous.connect_to("output", node, "input")
+            previous = node
+    return run
+
+@case("graph-append-chain", baseline="raw-chain-build", number=20)
+def graph_append_chain():
+    def run():
+        graph = gegl.Graph()
+        for i in range(CHAIN):
+            graph.append("nop")
+    return run
+
+# Inserting a node in the middle of the chain and removing it again
+
+@case("raw-insert-delete-middle", number=200)
+def raw_insert_delete_middle():
+    graph = G.Node()
+    nodes = [raw_node("gegl:nop", graph) for i in range(CHAIN)]
+    for previous, node in zip(nodes, nodes[1:]):
+        previous.connect_to("output", node, "input")
+    before, after = nodes[CHAIN // 2 - 1], nodes[CHAIN // 2]
+    def run():
+        node = raw_node("gegl:nop", graph)
+        before.connect_to("output", node, "input")
+        node.connect_to("output", after, "input")
+        node.disconnect("input")
+        graph.remove_child(node)
+        before.connect_to("output", after, "input")
+    return run
+
+@case("graph-insert-delete-middle", baseline="raw-insert-delete-middle",
+      number=200)
+def graph_insert_delete_middle():
+    graph = gegl.Graph(*(["nop"] * CHAIN))
+    def run():
+        graph.insert(CHAIN // 2, "nop")
+        del graph[CHAIN // 2]
+    return run
+
+
+# Buffers
+
+def buffer_cases():
+    for size in (64, 512, 2048):
+        number = max(2, 4096 * 64 // (size * size) * 10)
+        for format in ("RGBA u8", "RGBA float", "Y u8"):
+            suffix = "%d-%s" % (size, format.replace(" ", "-"))
+
+            def raw_get(size=size, format=format):
+                buffer = G.Buffer.new(format, 0, 0, size, size)
+                extent = buffer.get_extent()
+                return lambda: buffer.get(extent, 1.0, format,
+                                          G.AUTO_ROWSTRIDE)
+
+            def buffer_get(size=size, format=format):
+                buffer = gegl.Buffer((size, size), format)
+                return lambda: buffer.get()
+
+            def raw_set(size=size, format=format):
+                buffer = G.Buffer.new(format, 0, 0, size, size)
+                extent = buffer.get_extent()
+                data = buffer.get(extent, 1.0, format, G.AUTO_ROWSTRIDE)
+                return lambda: buffer.set(extent, format, data)
+
+            def buffer_set(size=size, format=format):
+                buffer = gegl.Buffer((size, size), format)
+                data = buffer.get()
+                return lambda: buffer.set(src=data)
+
+            case("raw-buffer-get-" + suffix, number=number)(raw_get)
+            case("buffer-get-" + suffix, baseline="raw-buffer-get-" + suffix,
+                 number=number)(buffer_get)
+            case("raw-buffer-set-" + suffix, number=number)(raw_set)
+            case("buffer-set-" + suffix, baseline="raw-buffer-set-" + suffix,
+                 number=number)(buffer_set)
+
+buffer_cases()
+
+
+# Small value objects
+
+@case("raw-color-churn", number=20000)
+def raw_color_churn():
+    def run():
+        color = G.Color()
+        color.set_rgba(0.1, 0.2, 0.3, 0.4)
+        rgba = color.get_rgba()
+        return rgba[0] + rgba[1] + rgba[2] + rgba[3]
+    return run
+
+@case("color-churn", baseline="raw-color-churn", number=20000)
+def color_churn():
+    def run():
+        color = gegl.Color(0.1, 0.2, 0.3, 0.4)
+        return color.r + color.g + color.b + color.a
+    return run
+
+@case("raw-color-parse", number=20000)
+def raw_color_parse():
+    return lambda: G.Color.new("#ff8000")
+
+@case("color-parse", baseline="raw-color-parse", number=20000)
+def color_parse():
+    return lambda: gegl.Color("#ff8000")
+
+@case("raw-rectangle-churn", number=20000)
+def raw_rectangle_churn():
+    def run():
+        rect = G.Rectangle()
+        rect.x, rect.y, rect.width, rect.height = 1, 2, 30, 40
+        return rect.x + rect.y + rect.width + rect.height
+    return run
+
+@case("rectangle-churn", baseline="raw-rectangle-churn", number=20000)
+def rectangle_churn():
+    def run():
+        rect = gegl.Rectangle(1, 2, 30, 40)
+        return rect.x + rect.y + rect.width + rect.height
+    return run
+
+
+# Full pipelines
+
+WORKDIR = tempfile.mkdtemp(prefix="pygegl-bench-")
+SOURCE = os.path.join(WORKDIR, "source.png")
+TARGET = os.path.join(WORKDIR, "target.png")
+
+def make_source(size=1024):
+    gegl.Graph(("checkerboard", {"x": 32, "y": 32}),
+               ("gaussian-blur", {"std-dev-x": 3, "std-dev-y": 3}),
+               ("crop", {"width": size, "height": size}),
+               ("png-save", {"path": SOURCE}))()
+
+@case("raw-pipeline", number=5)
+def raw_pipeline():
+    def run():
+        graph = G.Node()
+        load = raw_node("gegl:png-load", graph, path=SOURCE)
+        blur = raw_node("gegl:gaussian-blur", graph,
+                        **{"std-dev-x": 4.0, "std-dev-y": 4.0})
+        invert = raw_node("gegl:invert", graph)
+        save = raw_node("gegl:png-save", graph, path=TARGET)
+        load.connect_to("output", blur, "input")
+        blur.connect_to("output", invert, "input")
+        invert.connect_to("output", save, "input")
+        save.process()
+    return run
+
+@case("pipeline", baseline="raw-pipeline", number=5)
+def pipeline():
+    def run():
+        gegl.Graph(("png-load", {"path": SOURCE}),
+                   ("gaussian-blur", {"std-dev-x": 4.0, "std-dev-y": 4.0}),
+                   "invert",
+                   ("png-save", {"path": TARGET}))()
+    return run
+
+@case("pipeline-render-region", number=20)
+def pipeline_render_region():
+    graph = gegl.Graph(("png-load", {"path": SOURCE}),
+                       ("gaussian-blur", {"std-dev-x": 4.0, "std-dev-y": 4.0}),
+                       "invert")
+    return lambda: graph.render((256, 256, 256, 256))
+
+# Both render a fresh graph each time, so GEGL's node caches are cold
+
+def render_source_graph():
+    return gegl.Graph(("png-load", {"path": SOURCE}),
+                      ("gaussian-blur", {"std-dev-x": 4.0, "std-dev-y": 4.0}),
+                      "invert")
+
+@case("pipeline-render-full", number=5)
+def pipeline_render_full():
+    return lambda: render_source_graph().render((0, 0, 1024, 1024))
+
+@case("pipeline-render-parallel", baseline="pipeline-render-full", number=5)
+def pipeline_render_parallel():
+    return lambda: render_source_graph().render_parallel((0, 0, 1024, 1024))
+
+
+def run_cases(selected, repeat):
+    results = {}
+    for name, factory, baseline, number in CASES:
+        if selected and not any(word in name for word in selected):
+            continue
+        func = factory()
+        timings = timeit.repeat(func, number=number, repeat=repeat)
+        seconds = min(timings) / number
+        results[name] = {"seconds": seconds, "number": number,
+                         "baseline": baseline}
+        line = "%-40s %12.3f us" % (name, seconds * 1e6)
+        if baseline in results:
+            line += "   x%.2f of %s" % (
+                seconds / results[baseline]["seconds"], baseline)
+        print(line)
+    return results
+
+def compare(results, previous):
+    print("\n%-40s %12s %12s %8s" % ("case", "previous", "current", "ratio"))
+    for name, result in sorted(results.items()):
+        if name not in previous:
+            continue
+        old = previous[name]["seconds"]
+        print("%-40s %9.3f us %9.3f us %7.2fx" % (
+            name, old * 1e6, result["seconds"] * 1e6,
+            result["seconds"] / old))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-o", "--output", default="bench_results.json",
+                        help="JSON file where the results are written")
+    parser.add_argument("-k", dest="selected", action="append", default=[],
+                        help="only run cases containing this text")
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    args = parser.parse_args()
+
+    try:
+        make_source()
+        results = run_cases(args.selected, args.repeat)
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    data = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "gegl": ".".join(str(part) for part in G.get_version()),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as file_:
+        json.dump(data, file_, indent=2, sort_keys=True)
+    print("\nResults written to %s" % args.output)
+    if args.compare:
+        with open(args.compare) as file_:
+            compare(results, json.load(file_)["results"])
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 # coding: utf-8
 import gegl
+import gobject
 import gtk
 
 """
@@ -14,6 +15,8 @@ data directly to a gtk2 drawable.
 
 G = gegl.gegl._gegl
 SIZE = 640,480
+# milliseconds of rendering per main loop iteration, so the UI keeps responsive
+FRAME_BUDGET = 15
 
 def create_window():
     window = gtk.Window()
@@ -50,10 +53,31 @@ def blit(drawable, buffer):
                                data, rowstride=-1, xdith=0, ydith=0)
 
 
+# One processor per graph, reused across exposes, and the graphs
+# which have an idle handler pending
+processors = {}
+pending = set()
+
 def update(drawable, graph, canvas):
-    print "Hola!"
-    graph()
-    blit(drawable, graph[-1].buffer)
+    if id(graph) in pending:
+        # the pending handler will blit when it is done
+        return
+    processor = processors.get(id(graph))
+    if processor is None:
+        processor = processors[id(graph)] = gegl.Processor(
+            graph, (0, 0) + SIZE)
+    else:
+        # restarts the processor, picking up any changes to the graph
+        processor.rect = (0, 0) + SIZE
+    def step():
+        processor.work(FRAME_BUDGET)
+        if not processor.is_done:
+            return True
+        pending.discard(id(graph))
+        blit(drawable, graph[-1].buffer)
+        return False
+    pending.add(id(graph))
+    gobject.idle_add(step)
     #canvas.show()
 
 window, canvas, drawable = create_window()
@@ -5,10 +5,19 @@ from .gegl import Buffer
 from .gegl import Color
 from .gegl import Graph
 from .gegl import OpNode
+from .gegl import Processor
 from .gegl import Rectangle
+from .gegl import init
 from .gegl import list_operations
+from .gegl import schemas
 from .path import Path
+from .cache import RenderCache
+from .optimize import share
+from .pool import BufferPool
+from .pyramid import Pyramid
+from .arrays import ColorArray
+from .arrays import RectangleArray
 
 
 # in the gegl module, all GEGL public symbols exposed through
-# GIR are made available "raw"
+# GIR are made available "raw" - they are looked up on first access
@@ -0,0 +1,29 @@
+# coding: utf-8
+
+"""
+asyncio support - processing graphs without blocking the event loop.
+
+Kept in its own module so that the rest of the package doesn't
+depend on "async" syntax.
+"""
+
+import asyncio
+
+from .gegl import Processor
+
+
+async def process_async(graph, rect=None, step_budget_ms=10, progress=None):
+    """Processes graph in small steps, yielding to the event loop in between
+
+    GEGL's processor computes the graph a chunk at a time; chunks are
+    processed until step_budget_ms is used up, then control goes back to
+    the event loop. "progress", if given, is called with a number
+    between 0 and 1 after each step. Cancelling the task stops the
+    rendering after the current chunk.
+    """
+    processor = Processor(graph, rect)
+    while not processor.is_done:
+        processor.work(step_budget_ms)
+        if progress is not None:
+            progress(processor.progress)
+        await asyncio.sleep(0)
@@ -0,0 +1,397 @@
+# coding: utf-8
+
+"""
+numpy backed containers for many small GEGL values at once.
+
+These need numpy installed.
+"""
+
+from .gegl import _gegl
+from .gegl import _require_numpy as _import_numpy
+from .gegl import _format_layout, _parse_color
+from .gegl import Color, Rectangle
+
+# Set by _require_numpy - the arrays can only be created once it was called
+numpy = None
+
+def _require_numpy():
+    global numpy
+    numpy = _import_numpy()
+
+
+class RectangleArray(object):
+    """Many rectangles, stored as an (N, 4) int array of x, y, width, height
+
+    All operations work on the whole array at once:
+    >>> rects = gegl.RectangleArray([(0, 0, 10, 10), (5, 5, 10, 10)])
+    >>> rects.intersect((0, 0, 8, 8))
+    RectangleArray([[0, 0, 8, 8], [5, 5, 3, 3]])
+
+    Rectangles with zero width or height are empty.
+    """
+    def __init__(self, rects=()):
+        _require_numpy()
+        if isinstance(rects, RectangleArray):
+            data = rects.data.copy()
+        elif isinstance(rects, numpy.ndarray):
+            data = numpy.array(rects, dtype="int64").reshape(-1, 4)
+        else:
+            data = numpy.array([_as_tuple(rect) for rect in rects],
+                               dtype="int64").reshape(-1, 4)
+        self.data = data
+
+    @classmethod
+    def _from_data(cls, data):
+        self = cls.__new__(cls)
+        self.data = data
+        return self
+
+    x = property(lambda s: s.data[:, 0])
+    y = property(lambda s: s.data[:, 1])
+    width = property(lambda s: s.data[:, 2])
+    height = property(lambda s: s.data[:, 3])
+    right = property(lambda s: s.data[:, 0] + s.data[:, 2])
+    bottom = property(lambda s: s.data[:, 1] + s.data[:, 3])
+
+    @property
+    def area(self):
+        return self.data[:, 2] * self.data[:, 3]
+
+    def is_empty(self):
+        return (self.data[:, 2] <= 0) | (self.data[:, 3] <= 0)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, numpy.integer)):
+            return Rectangle(*self.data[index].tolist())
+        return self._from_data(self.data[index])
+
+    def __iter__(self):
+        for row in self.data.tolist():
+            yield Rectangle(*row)
+
+    def to_rectangles(self):
+        return list(self)
+
+    def to_native(self):
+        """Returns a list of gegl.gegl._gegl.Rectangle objects"""
+        return [Rectangle(*row).rect for row in self.data.tolist()]
+
+    def intersect(self, other):
+        """Intersection of each rectangle with other
+
+        other can be a single rectangle, or a RectangleArray
+        with the same length. Rectangles that don't overlap
+        become empty (0 width and height) at the position of the first one.
+        """
+        other = _as_data(other)
+        x0 = numpy.maximum(self.data[:, 0], other[:, 0])
+        y0 = numpy.maximum(self.data[:, 1], other[:, 1])
+        x1 = numpy.minimum(self.right, other[:, 0] + other[:, 2])
+        y1 = numpy.minimum(self.bottom, other[:, 1] + other[:, 3])
+        empty = (x1 <= x0) | (y1 <= y0)
+        result = numpy.stack([x0, y0, x1 - x0, y1 - y0], axis=1)
+        result[empty] = 0
+        result[empty, :2] = self.data[empty, :2]
+        return self._from_data(result)
+
+    def union(self, other):
+        """Bounding box of each rectangle and other - as in
+        gegl_rectangle_bounding_box. Empty rectangles are ignored.
+        """
+        other = numpy.broadcast_to(_as_data(other), self.data.shape)
+        x0 = numpy.minimum(self.data[:, 0], other[:, 0])
+        y0 = numpy.minimum(self.data[:, 1], other[:, 1])
+        x1 = numpy.maximum(self.right, other[:, 0] + other[:, 2])
+        y1 = numpy.maximum(self.bottom, other[:, 1] + other[:, 3])
+        result = numpy.stack([x0, y0, x1 - x0, y1 - y0], axis=1)
+        self_empty = self.is_empty()
+        other_empty = (other[:, 2] <= 0) | (other[:, 3] <= 0)
+        result[self_empty] = other[self_empty]
+        result[other_empty & ~self_empty] = self.data[other_empty & ~self_empty]
+        return self._from_data(result)
+
+    def contains(self, other):
+        """Returns a bool array - True where each rectangle fully
+        contains other (a rectangle or a RectangleArray)
+        """
+        other = _as_data(other)
+        return ((self.data[:, 0] <= other[:, 0]) &
+                (self.data[:, 1] <= other[:, 1]) &
+                (self.right >= other[:, 0] + other[:, 2]) &
+                (self.bottom >= other[:, 1] + other[:, 3]))
+
+    def bounding_box(self):
+        """Returns a single Rectangle containing all non-empty rectangles"""
+        data = self.data[~self.is_empty()]
+        if not len(data):
+            return Rectangle(0, 0, 0, 0)
+        x0, y0 = data[:, 0].min(), data[:, 1].min()
+        x1 = (data[:, 0] + data[:, 2]).max()
+        y1 = (data[:, 1] + data[:, 3]).max()
+        return Rectangle(int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+
+    def align(self, tile_width, tile_height=None, superset=True):
+        """Snaps each rectangle to a tile grid starting at 0, 0
+
+        With superset=True rectangles grow to cover whole tiles,
+        otherwise they shrink to the whole tiles they contain.
+        """
+        if tile_height is None:
+            tile_height = tile_width
+        size = numpy.array([tile_width, tile_height])
+        start = self.data[:, :2]
+        end = start + self.data[:, 2:]
+        if superset:
+            start = numpy.floor_divide(start, size) * size
+            end = -numpy.floor_divide(-end, size) * size
+        else:
+            start = -numpy.floor_divide(-start, size) * size
+            end = numpy.floor_divide(end, size) * size
+        extent = numpy.maximum(end - start, 0)
+        return self._from_data(numpy.concatenate([start, extent], axis=1))
+
+    def coalesce(self):
+        """Merges rectangles that together form a larger rectangle
+
+        Rectangles in a row with the same vertical span that touch or
+        overlap are joined, then the same is done for columns, until
+        nothing else can be merged. Empty rectangles are dropped.
+        The covered area is unchanged.
+        """
+        data = self.data[~self.is_empty()]
+        while len(data):
+            count = len(data)
+            data = _merge_runs(data, 0)
+            data = _merge_runs(data, 1)
+            if len(data) == count:
+                break
+        return self._from_data(data)
+
+    def __eq__(self, other):
+        other = _as_data(other)
+        return self.data.shape == other.shape and bool(
+            (self.data == other).all())
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "RectangleArray(%s)" % self.data.tolist()
+
+
+# Luminance weights of linear sRGB primaries, as used by babl
+_LUMINANCE = (0.22248840, 0.71690369, 0.06060791)
+
+_INTEGER_MAX = {"uint8": 255, "uint16": 65535, "uint32": 4294967295}
+
+def _to_gamma(linear):
+    # sRGB transfer curve
+    return numpy.where(linear <= 0.0031308, linear * 12.92,
+                       1.055 * numpy.power(numpy.maximum(linear, 0),
+                                           1 / 2.4) - 0.055)
+
+def _to_linear(gamma):
+    return numpy.where(gamma <= 0.04045, gamma / 12.92,
+                       numpy.power((numpy.maximum(gamma, 0) + 0.055) / 1.055,
+                                   2.4))
+
+def _split_format(format):
+    components, dtype = _format_layout(format)
+    model = format.rpartition(" ")[0] if format not in (
+        "cairo-ARGB32", "cairo-RGB24") else format
+    return model, components, dtype
+
+_MODELS = {
+    # model: (channels, gamma encoded, premultiplied, has alpha)
+    "RGBA": ("rgb", False, False, True),
+    "RGB": ("rgb", False, False, False),
+    "RaGaBaA": ("rgb", False, True, True),
+    "R'G'B'A": ("rgb", True, False, True),
+    "R'G'B'": ("rgb", True, False, False),
+    "R'aG'aB'aA": ("rgb", True, True, True),
+    "Y": ("y", False, False, False),
+    "YA": ("y", False, False, True),
+    "YaA": ("y", False, True, True),
+    "Y'": ("y", True, False, False),
+    "Y'A": ("y", True, False, True),
+    "Y'aA": ("y", True, True, True),
+    "cairo-ARGB32": ("bgr", True, True, True),
+    "cairo-RGB24": ("bgr", True, False, False),
+}
+
+
+class ColorArray(object):
+    """Many colors, stored as an (N, 4) float array of linear RGBA
+
+    The components are the same returned by Color.get_rgba.
+    Colors can be converted, all at once, to and from the pixel
+    data of several babl formats:
+    >>> palette = gegl.ColorArray(["red", "#00ff00", (0, 0, 1)])
+    >>> palette.to_format("R'G'B'A u8")
+    """
+    def __init__(self, colors=()):
+        _require_numpy()
+        if isinstance(colors, ColorArray):
+            data = colors.data.copy()
+        elif isinstance(colors, numpy.ndarray):
+            data = numpy.array(colors, dtype="float64")
+            if data.ndim == 2 and data.shape[1] == 3:
+                data = numpy.concatenate(
+                    [data, numpy.ones((len(data), 1))], axis=1)
+            data = data.reshape(-1, 4)
+        else:
+            data = numpy.array([_as_rgba(color) for color in colors],
+                               dtype="float64").reshape(-1, 4)
+        self.data = data
+
+    @classmethod
+    def _from_data(cls, data):
+        self = cls.__new__(cls)
+        self.data = data
+        return self
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, numpy.integer)):
+            return Color(*self.data[index].tolist())
+        return self._from_data(self.data[index])
+
+    def __setitem__(self, index, value):
+        if isinstance(value, ColorArray):
+            self.data[index] = value.data
+        else:
+            self.data[index] = _as_rgba(value)
+
+    def __iter__(self):
+        for row in self.data.tolist():
+            yield Color(*row)
+
+    def to_colors(self):
+        return list(self)
+
+    def to_format(self, format):
+        """Returns the colors as an (N, components) array of pixels
+        in the given babl format - as in "R'G'B'A u8" or "Y float"
+        """
+        model, components, dtype = _split_format(format)
+        if model not in _MODELS:
+            raise ValueError("Unsupported color model '%s'" % model)
+        channels, gamma, premultiplied, alpha = _MODELS[model]
+        rgb, a = self.data[:, :3], self.data[:, 3:]
+        if channels == "y":
+            rgb = (rgb * _LUMINANCE).sum(axis=1, keepdims=True)
+        if gamma:
+            rgb = _to_gamma(rgb)
+        if premultiplied:
+            rgb = rgb * a
+        if channels == "bgr":
+            rgb = rgb[:, ::-1]
+        if alpha:
+            result = numpy.concatenate([rgb, a], axis=1)
+        elif channels == "bgr":
+            result = numpy.concatenate([rgb, numpy.ones_like(a)], axis=1)
+        else:
+            result = rgb
+        if dtype in _INTEGER_MAX:
+            maximum = _INTEGER_MAX[dtype]
+            result = numpy.rint(numpy.clip(result, 0, 1) * maximum)
+        return result.astype(dtype)
+
+    @classmethod
+    def from_format(cls, data, format):
+        """Creates a ColorArray from (N, components) pixels in a babl format"""
+        _require_numpy()
+        model, components, dtype = _split_format(format)
+        if model not in _MODELS:
+            raise ValueError("Unsupported color model '%s'" % model)
+        channels, gamma, premultiplied, alpha = _MODELS[model]
+        data = numpy.asarray(data).reshape(-1, components).astype("float64")
+        if dtype in _INTEGER_MAX:
+            data = data / _INTEGER_MAX[dtype]
+        if channels == "y":
+            rgb = numpy.repeat(data[:, :1], 3, axis=1)
+        elif channels == "bgr":
+            rgb = data[:, 2::-1]
+        else:
+            rgb = data[:, :3]
+        if alpha:
+            a = data[:, -1:] if channels != "bgr" else data[:, 3:4]
+        else:
+            a = numpy.ones((len(data), 1))
+        if premultiplied:
+            rgb = numpy.where(a > 0, rgb / numpy.where(a > 0, a, 1), 0)
+        if gamma:
+            rgb = _to_linear(rgb)
+        return cls._from_data(numpy.concatenate([rgb, a], axis=1))
+
+    def __eq__(self, other):
+        other = other.data if isinstance(other, ColorArray) else (
+            ColorArray(other).data)
+        return self.data.shape == other.shape and bool(
+            (self.data == other).all())
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "ColorArray(%s)" % self.data.tolist()
+
+
+def _as_rgba(color):
+    if isinstance(color, Color):
+        return color.get_rgba()
+    if isinstance(color, _gegl.Color):
+        return tuple(color.get_rgba())
+    if isinstance(color, str):
+        return _parse_color(color)
+    color = tuple(color)
+    if len(color) == 3:
+        color += (1.0,)
+    return color
+
+
+def _as_tuple(rect):
+    if isinstance(rect, (Rectangle, _gegl.Rectangle)):
+        return Rectangle(rect).as_sequence()
+    return tuple(rect)
+
+def _as_data(other):
+    if isinstance(other, RectangleArray):
+        return other.data
+    if isinstance(other, numpy.ndarray):
+        return other.reshape(-1, 4)
+    if isinstance(other, (Rectangle, _gegl.Rectangle)) or (
+            len(other) == 4 and not hasattr(other[0], "__len__")):
+        return numpy.array([_as_tuple(other)], dtype="int64")
+    return RectangleArray(other).data
+
+def _merge_runs(data, axis):
+    # Joins rectangles with the same span on the other axis that
+    # touch or overlap along "axis" (0 for x, 1 for y)
+    other = 1 - axis
+    start = data[:, axis]
+    order = numpy.lexsort((start, data[:, other + 2], data[:, other]))
+    data = data[order]
+    start = data[:, axis]
+    end = start + data[:, axis + 2]
+    same_span = ((data[1:, other] == data[:-1, other]) &
+                 (data[1:, other + 2] == data[:-1, other + 2]))
+    group = numpy.concatenate([[0], numpy.cumsum(~same_span)])
+    # running maximum of the end coordinate, restarted on each span group
+    offset = int(end.max() - start.min()) + 1
+    running_end = numpy.maximum.accumulate(end + group * offset) - group * offset
+    new_run = numpy.concatenate(
+        [[True], ~same_span | (start[1:] > running_end[:-1])])
+    runs = numpy.flatnonzero(new_run)
+    merged = data[runs].copy()
+    merged[:, axis + 2] = numpy.maximum.reduceat(end, runs) - merged[:, axis]
+    return merged
@@ -0,0 +1,182 @@
+# coding: utf-8
+
+"""
+Memoization of rendered node output.
+
+Results are keyed on a fingerprint of the rendered node - its operation
+and property values, the same data compared by OpNode.__eq__ - combined
+with the fingerprints of the nodes upstream of it.
+
+Buffers can't be fingerprinted by their contents, which change without
+notice (Buffer.set, Buffer.invalidate, reuse from a BufferPool), so
+nodes reading from a Buffer, and everything downstream of them,
+are never cached.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .gegl import _gegl, _blit_for_scale, _bytes_per_pixel, _wrapper_of
+from .gegl import Buffer, Color, Graph, OpNode, Rectangle
+from .path import Path
+
+
+def _value_key(value):
+    # A stable representation of a property value
+    if isinstance(value, Color):
+        return ("color",) + tuple(value.get_rgba())
+    elif isinstance(value, Rectangle):
+        return ("rectangle",) + value.as_sequence()
+    elif isinstance(value, Path):
+        return ("path", value._path.to_string())
+    elif isinstance(value, Buffer):
+        # Only tells buffers alive at the same time apart: the address
+        # of a freed buffer can be reused, and contents are not looked at
+        return ("buffer", hash(value.buffer))
+    return repr(value)
+
+def _wrap(raw_node):
+    wrapper = _wrapper_of(raw_node)
+    if not isinstance(wrapper, OpNode):
+        wrapper = OpNode._from_raw_node(raw_node)
+    return wrapper
+
+def fingerprint(node, _memo=None):
+    """Returns a hex digest identifying what the node output looks like
+
+    Two nodes with the same operation, the same property values and
+    equivalent producers on their "input" and "aux" pads have
+    the same fingerprint. Buffer properties are compared by identity,
+    not contents.
+    """
+    if isinstance(node, Graph):
+        node = node._output_node()
+    if _memo is None:
+        _memo = {}
+    if id(node._node) in _memo:
+        return _memo[id(node._node)]
+    parts = [node.operation]
+    for prop in sorted(node.properties):
+        value = node[prop]
+        if isinstance(value, Buffer):
+            _memo["reads_buffers"] = True
+        parts.append((prop, _value_key(value)))
+    for pad in ("input", "aux"):
+        if node.has_pad(pad):
+            producer = node._node.get_producer(pad, None)
+            if producer is not None:
+                parts.append((pad, fingerprint(_wrap(producer), _memo)))
+    result = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+    _memo[id(node._node)] = result
+    return result
+
+
+class _LRUCache(object):
+    # Bookkeeping shared by the size capped caches: entries are kept
+    # as (value, size) pairs, least recently used first, and dropped
+    # when their sizes add up to more than max_bytes.
+    # Methods with a leading underscore expect self._lock to be held.
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _store(self, key, value, size):
+        if key not in self._entries:
+            self._entries[key] = (value, size)
+            self.bytes += size
+        self._trim()
+
+    def _discard(self, key):
+        value, size = self._entries.pop(key)
+        self.bytes -= size
+        return value
+
+    def _trim(self):
+        while self.bytes > self.max_bytes and self._entries:
+            key, (value, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+            self._evicted(key, value)
+
+    def _evicted(self, key, value):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+        }
+
+
+class RenderCache(_LRUCache):
+    """Opt-in cache of rendered Graph and OpNode output
+
+    >>> cache = gegl.RenderCache(max_bytes=64 * 1024 * 1024)
+    >>> buffer = cache.render(graph, (0, 0, 256, 256))
+
+    Results are kept as Buffers; when the total size of the cached
+    buffers goes over max_bytes the least recently used ones are dropped.
+    Nodes reading from a Buffer (eg. "buffer-source") are rendered
+    every time, as the buffer contents may have changed.
+    Returned buffers are shared between callers and should not be written to.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        _LRUCache.__init__(self, max_bytes)
+
+    def render(self, node, rect, scale=1.0, format="RGBA u8"):
+        """Returns a Buffer with the output of node (OpNode or Graph) in rect"""
+        if isinstance(node, Graph):
+            node = node._output_node()
+        if not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        memo = {}
+        key = (fingerprint(node, memo), rect.as_sequence(), scale, format)
+        if "reads_buffers" in memo:
+            return self._render(node, rect, scale, format)
+        with self._lock:
+            buffer = self._lookup(key)
+        if buffer is not None:
+            return buffer
+        buffer = self._render(node, rect, scale, format)
+        size = rect.width * rect.height * _bytes_per_pixel(format)
+        with self._lock:
+            self._store(key, buffer, size)
+        return buffer
+
+    @staticmethod
+    def _render(node, rect, scale, format):
+        source = _blit_for_scale(node, rect, scale, format)
+        if scale == 1:
+            return source
+        buffer = Buffer(rect, format)
+        buffer.set(rect, format, source.buffer.get(
+            rect.rect, scale, format, _gegl.AUTO_ROWSTRIDE))
+        return buffer
@@ -1,20 +1,414 @@
 # coding: utf-8
 # Author: João S. O. Bueno
 
+import hashlib
+import json
+import math
+import mmap
+import os
 import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
 import gi
 gi.require_version("Gegl", "0.4")
 from gi.repository import Gegl as _gegl
 from .path import Path
 
+# numpy is optional, and imported by _require_numpy when first needed:
+# it would take most of the time spent importing this package
+numpy = None
+
 DEFAULT_OP_NAMESPACE = "gegl"
 
-_gegl.init(sys.argv[1:])
+# babl component types and their numpy counterparts
+_BABL_TYPES = {
+    "u8": "uint8",
+    "u16": "uint16",
+    "u32": "uint32",
+    "half": "float16",
+    "float": "float32",
+    "double": "float64",
+}
+
+_BABL_SPECIAL_FORMATS = {
+    "cairo-ARGB32": (4, "uint8"),
+    "cairo-RGB24": (4, "uint8"),
+    "cairo-A8": (1, "uint8"),
+}
+
+# Largest amount of data copied at once between Python memory and a Buffer
+_STRIP_BYTES = 4 * 1024 * 1024
+
+_initialized = False
+_init_lock = threading.Lock()
+
+# Python wrappers (OpNode and Graph) of native nodes, and the Graph
+# each native node was added to. Keyed on the native object address
+# (which is what PyGObject hashes on) and holding only weak references,
+# so that native objects never keep Python wrappers alive.
+_wrappers = weakref.WeakValueDictionary()
+_parents = weakref.WeakValueDictionary()
+
+def init(args=(), **config):
+    """Initializes GEGL
+
+    There is no need to call this: GEGL is initialized the first time
+    it is needed, without any command line arguments. Call it to pass
+    arguments (as in "--gegl-threads=4") or to change GEGL's
+    configuration - keyword arguments are properties of GeglConfig,
+    with "_" in place of "-", eg.:
+    >>> gegl.init(threads=4, tile_cache_size=512 * 1024 * 1024)
+    """
+    global _initialized
+    with _init_lock:
+        if not _initialized:
+            _gegl.init(list(args))
+            _initialized = True
+    if config:
+        gegl_config = _gegl.config()
+        for key, value in config.items():
+            gegl_config.set_property(key.replace("_", "-"), value)
+
+def _wrapper_of(native):
+    # The live OpNode or Graph wrapping a native node, if any
+    if native is None:
+        return None
+    return _wrappers.get(hash(native))
+
+def _parent_of(native):
+    # The live Graph a native node was added to, if any
+    if native is None:
+        return None
+    return _parents.get(hash(native))
+
+def _walk(graph, seen):
+    # Yields all OpNodes in graph, its sub-graphs and the
+    # graphs plugged in aux pads
+    for child in graph._children:
+        if isinstance(child, Graph):
+            for node in _walk(child, seen):
+                yield node
+            continue
+        if id(child._node) in seen:
+            continue
+        seen.add(id(child._node))
+        if child.has_pad("aux"):
+            producer = child._node.get_producer("aux", None)
+            aux_graph = _parent_of(producer)
+            if isinstance(aux_graph, Graph):
+                for node in _walk(aux_graph, seen):
+                    yield node
+        yield child
+
+def _ensure_init():
+    if not _initialized:
+        init()
 
 def list_operations(filter=""):
+    _ensure_init()
     ops = _gegl.list_operations()
     return [op for op in ops if filter in op]
 
+
+def _format_layout(format):
+    """Returns the number of components and numpy dtype name
+    for pixels of a babl format name such as "RGBA u8" or "Y'A float"
+    """
+    if format in _BABL_SPECIAL_FORMATS:
+        return _BABL_SPECIAL_FORMATS[format]
+    model, _, type_name = format.rpartition(" ")
+    if not model or type_name not in _BABL_TYPES:
+        raise ValueError("Unsupported pixel format '%s'" % format)
+    if model.startswith("CIE "):
+        components = 4 if model.endswith(" alpha") else 3
+    else:
+        # each component has an uppercase letter: "RGBA", "R'aG'aB'aA", "YaA"
+        components = sum(1 for char in model if char.isupper())
+    if not components:
+        raise ValueError("Unsupported pixel format '%s'" % format)
+    return components, _BABL_TYPES[type_name]
+
+def _bytes_per_pixel(format):
+    components, dtype = _format_layout(format)
+    sizes = {"uint8": 1, "uint16": 2, "uint32": 4,
+             "float16": 2, "float32": 4, "float64": 8}
+    return components * sizes[dtype]
+
+def _format_from_array(arr):
+    # Guesses a babl format name for an array shaped (height, width[, components])
+    components = arr.shape[2] if arr.ndim == 3 else 1
+    models = {1: "Y", 2: "YA", 3: "RGB", 4: "RGBA"}
+    types = {dtype: type_name for type_name, dtype in _BABL_TYPES.items()}
+    if components not in models or arr.dtype.name not in types:
+        raise ValueError("Can't guess a pixel format for an array "
+                         "with shape %s and dtype %s" % (arr.shape, arr.dtype))
+    return "%s %s" % (models[components], types[arr.dtype.name])
+
+def _array_rows(arr, rowstride=None):
+    # A flat view over the memory of arr, and its row stride. arr can
+    # be a slice of a larger array, as long as each row is contiguous.
+    if rowstride is not None and rowstride != arr.strides[0]:
+        raise ValueError("rowstride %d does not match the array strides %s" %
+                         (rowstride, arr.strides))
+    if arr.flags.c_contiguous:
+        return arr, arr.strides[0]
+    rowstride = arr.strides[0]
+    if rowstride <= 0 or not arr[0].flags.c_contiguous:
+        raise ValueError("Only arrays with contiguous rows "
+                         "can be used in a Buffer")
+    span = rowstride * (arr.shape[0] - 1) + arr[0].nbytes
+    flat = numpy.lib.stride_tricks.as_strided(
+        arr, shape=(span // arr.itemsize,), strides=(arr.itemsize,))
+    return flat, rowstride
+
+# GEGL gives infinite areas (as the output of "color") huge sizes
+_INFINITE_SIZE = 1 << 24
+
+def _is_infinite(rect):
+    return rect.width >= _INFINITE_SIZE or rect.height >= _INFINITE_SIZE
+
+def _require_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("This feature requires numpy to be installed")
+    return numpy
+
+def _is_array(obj):
+    # An ndarray can only exist once numpy was imported by someone,
+    # so this doesn't import it
+    module = sys.modules.get("numpy")
+    return module is not None and isinstance(obj, module.ndarray)
+
+
+def _to_color(value):
+    if not isinstance(value, Color):
+        value = Color(value)
+    return value._color
+
+def _to_buffer(value):
+    if not isinstance(value, Buffer):
+        value = Buffer(value)
+    return value.buffer
+
+def _to_path(value):
+    if not isinstance(value, Path):
+        value = Path(value)
+    return value._path
+
+def _to_rectangle(value):
+    if not isinstance(value, Rectangle):
+        value = Rectangle(value)
+    return value.rect
+
+def _enum_codec(name, values):
+    # values maps the enum nicks (as in "clamp", "fir") to their numbers
+    def encode(value):
+        if isinstance(value, str):
+            try:
+                return values[value.replace("_", "-").lower()]
+            except KeyError:
+                raise ValueError("%s should be one of %s" %
+                                 (name, ", ".join(sorted(values))))
+        return value
+    return encode
+
+def _range_codec(minimum, maximum):
+    def encode(value):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            if value < minimum:
+                return minimum
+            if value > maximum:
+                return maximum
+        return value
+    return encode
+
+def _codec_for(name, type_name, constraints=None):
+    # Picks the function that turns a Python value into what
+    # the GEGL property expects. The choice depends only on
+    # data that can be stored in the on-disk cache.
+    if type_name == "GType GeglColor":
+        return _to_color
+    elif type_name == "GType GeglBuffer" or name == "buffer":
+        return _to_buffer
+    elif type_name == "GType GeglPath":
+        return _to_path
+    elif type_name == "GType GeglRectangle":
+        return _to_rectangle
+    if constraints:
+        if "enum" in constraints:
+            return _enum_codec(name, constraints["enum"])
+        elif "range" in constraints:
+            return _range_codec(*constraints["range"])
+    # TODO: check for other special attribute types
+    return None
+
+def _constraints_for(prop):
+    # Enum values and numeric ranges of a GParamSpec, as plain data
+    enum_class = getattr(prop, "enum_class", None)
+    if enum_class is not None:
+        return {"enum": {value.value_nick: int(value) for value
+                         in enum_class.__enum_values__.values()}}
+    minimum = getattr(prop, "minimum", None)
+    maximum = getattr(prop, "maximum", None)
+    if (isinstance(minimum, (int, float)) and
+            isinstance(maximum, (int, float))):
+        return {"range": [minimum, maximum]}
+    return None
+
+def _plain_value(value):
+    # Only values that survive a trip through JSON are kept as defaults
+    if value is None or isinstance(value, (bool, str, float)):
+        return value
+    if isinstance(value, int):
+        # enums and flags are int subclasses
+        return int(value)
+    return None
+
+
+class OperationSchema(object):
+    """Description of a GEGL operation - its properties and pads
+
+    Built once per operation name and shared by all OpNodes using
+    that operation.
+    property_types maps each property name to a
+    (type name, GType, GParamSpec) tuple - the last two are None
+    when the schema was loaded from a cache file.
+    codecs maps each property name to the function converting
+    Python values for it (or None when no conversion is needed):
+    colors, paths, buffers and rectangles are wrapped, enums
+    can be given by their nick and numbers are clamped to the
+    property range.
+    """
+    def __init__(self, name, property_types, defaults, pads,
+                 constraints=None):
+        self.name = name
+        self.property_types = property_types
+        self.property_names = frozenset(property_types)
+        self.defaults = defaults
+        self.pads = frozenset(pads)
+        self.constraints = constraints or {}
+        self.codecs = {
+            prop: _codec_for(prop, types[0], self.constraints.get(prop))
+            for prop, types in property_types.items()
+        }
+
+    @classmethod
+    def from_operation(cls, name):
+        _ensure_init()
+        # the actual value_type object is not, for now, as usefull as its str
+        # so we are keeping both
+        property_types = {}
+        defaults = {}
+        constraints = {}
+        for prop in _gegl.Operation.list_properties(name):
+            property_types[prop.name] = (
+                repr(prop.value_type).strip("<>").rsplit(None,1)[0],
+                prop.value_type,
+                prop)
+            defaults[prop.name] = _plain_value(
+                getattr(prop, "default_value", None))
+            constraints[prop.name] = _constraints_for(prop)
+        node = _gegl.Node()
+        node.set_property("operation", name)
+        pads = list(node.list_input_pads()) + list(node.list_output_pads())
+        return cls(name, property_types, defaults, pads, constraints)
+
+    def to_dict(self):
+        return {
+            "properties": {prop: [types[0], self.defaults.get(prop),
+                                  self.constraints.get(prop)]
+                           for prop, types in self.property_types.items()},
+            "pads": sorted(self.pads),
+        }
+
+    @classmethod
+    def from_dict(cls, name, data):
+        property_types = {}
+        defaults = {}
+        constraints = {}
+        for prop, values in data["properties"].items():
+            property_types[prop] = (values[0], None, None)
+            defaults[prop] = values[1]
+            # files from older versions have no constraints
+            constraints[prop] = values[2] if len(values) > 2 else None
+        return cls(name, property_types, defaults, data["pads"], constraints)
+
+    def __repr__(self):
+        return "OperationSchema('%s')" % self.name
+
+
+class SchemaRegistry(object):
+    """Process wide cache of OperationSchema objects
+
+    Schemas are introspected the first time an operation name
+    is requested. The registry can be filled in advance with "warm",
+    and saved to or loaded from a JSON file, so that
+    new processes don't have to introspect the operations again.
+    """
+    def __init__(self):
+        self._schemas = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, operation):
+        try:
+            return self._schemas[operation]
+        except KeyError:
+            pass
+        schema = OperationSchema.from_operation(operation)
+        with self._lock:
+            return self._schemas.setdefault(operation, schema)
+
+    def __contains__(self, operation):
+        return operation in self._schemas
+
+    def __len__(self):
+        return len(self._schemas)
+
+    def warm(self, operations=None):
+        """Introspects the given operations - or all available ones"""
+        if operations is None:
+            operations = list_operations()
+        for operation in operations:
+            self[operation]
+
+    def clear(self):
+        with self._lock:
+            self._schemas.clear()
+
+    def save(self, path):
+        data = {
+            "gegl-version": list(_gegl.get_version()),
+            "operations": {name: schema.to_dict()
+                           for name, schema in self._schemas.items()},
+        }
+        with open(path, "w") as file_:
+            json.dump(data, file_)
+
+    def load(self, path):
+        """Fills the registry from a file written by "save"
+
+        Returns the number of schemas loaded - 0 if the
+        file was written by another GEGL version.
+        """
+        with open(path) as file_:
+            data = json.load(file_)
+        if data.get("gegl-version") != list(_gegl.get_version()):
+            return 0
+        with self._lock:
+            for name, schema_data in data["operations"].items():
+                if name not in self._schemas:
+                    self._schemas[name] = OperationSchema.from_dict(
+                        name, schema_data)
+        return len(data["operations"])
+
+
+schemas = SchemaRegistry()
+
 class OpNode(object):
     """ Wrapper for a GEGL node with an operation
 
@@ -22,15 +416,16 @@ class OpNode(object):
     to the GEGL node as exposed by pygobject
     """
     def __init__(self, operation, **kw):
+        _ensure_init()
         object.__setattr__(self, "_node",  _gegl.Node())
-        # cyclic - TODO: replace with weakref
-        self._node._wrapper = self
+        _wrappers[hash(self._node)] = self
         self.operation = operation
-        for key, value in kw.items():
-            setattr(self, key, value)
+        if kw:
+            self.set(**kw)
 
     @classmethod
     def _from_raw_node(cls, _node):
+        _ensure_init()
         self = cls.__new__(cls)
         object.__setattr__(self, "_node",  _node)
         return self
@@ -76,22 +471,10 @@ class OpNode(object):
         if not attr in self.properties:
             raise KeyError("%s not a property for this operation" % attr)
 
-        if self._property_types[attr][0] == "GType GeglColor":
-            if not isinstance(value, Color):
-                value = Color(value)
-            value = value._color
-        elif self._property_types[attr][2].name == "buffer":
-            if not isinstance(value, Buffer):
-                value = Buffer(value)
-            value = value.buffer
-        elif self._property_types[attr][0] == 'GType GeglPath':
-            if not isinstance(value, Path):
-                value = Path(value)
-            value = value._path
-        #Currently there are no ops that use Rectangle as an input parameter 
-        #  
+        codec = self._schema.codecs[attr]
+        if codec is not None:
+            value = codec(value)
         # TODO: write tests for this parameter wrapping stuff
-        # TODO: check for other special attribute types
         self._node.set_property(attr, value)
 
     def __getitem__(self, attr):
@@ -115,23 +498,17 @@ class OpNode(object):
         return self._property_names
 
     def _reset_properties(self):
-        #Caches in Python the property names and descriptions
-        #for the GEGL operation.
+        #Retrieves the property names and descriptions
+        #for the GEGL operation from the shared schema registry.
 
         #Sets up some required attributes for the object, since
         #__init__ may not be called, depending on the 
         #factory function called.
         self._pads = {"output":[]}
-        # the actual value_type object is not, for now, as usefull as its str
-        # so we are keeping both
-        properties = {
-            prop.name: (repr(prop.value_type).strip("<>").rsplit(None,1)[0],
-                        prop.value_type,
-                        prop)
-            for prop in _gegl.Operation().list_properties(self.operation)
-            }
-        self._property_names = set(properties.keys())
-        self._property_types = properties
+        schema = schemas[self.operation]
+        self._schema = schema
+        self._property_names = schema.property_names
+        self._property_types = schema.property_types
 
     def connect_from(self, other, output="output", input="input"):
         connect_wrapper = None
@@ -144,7 +521,7 @@ class OpNode(object):
             connected_wrapper = other
             other = other._node
         else:
-            connected_wrapper = other._wrapper
+            connected_wrapper = _wrapper_of(other)
         # syncronize the references in the other node High
         # level data structures:
         if connected_wrapper:
@@ -162,8 +539,8 @@ class OpNode(object):
         if isinstance(other, OpNode):
             connect_wrapper = other
             other = other._node
-        elif hasattr(other, "_wrapper"):
-            connect_wrapper = other._wrapper
+        else:
+            connect_wrapper = _wrapper_of(other)
         # syncronize the references in the other node High
         # level data structures:
         if connect_wrapper:
@@ -179,15 +556,39 @@ class OpNode(object):
     def _get_pad(self, pad):
         return self._pads[pad]
 
+    @property
+    def _parent_graph(self):
+        return _parent_of(self._node)
+
     def has_pad(self, pad="output"):
-        return self._node.has_pad(pad)
+        if not "_schema" in self.__dict__:
+            self._reset_properties()
+        return pad in self._schema.pads
 
     def get_producer(self, pad="input", extra=None):
         return self._node.get_producer(pad, extra)
     
     def set(self, **kwargs):
+        """Sets several properties at once
+
+        Values are converted with the operation codecs and then
+        handed to GEGL in a single call.
+        """
+        properties = {}
+        if not "_schema" in self.__dict__:
+            self._reset_properties()
+        codecs = self._schema.codecs
         for key, value in kwargs.items():
-            setattr(self, key, value)
+            if key in {"aux", "input", "output", "operation"}:
+                setattr(self, key, value)
+                continue
+            attr = key.replace("_", "-")
+            if not attr in codecs:
+                raise ValueError("%s not a property for this operation" % attr)
+            codec = codecs[attr]
+            properties[attr] = codec(value) if codec is not None else value
+        if properties:
+            self._node.set_properties(**properties)
     
     # And an alias to the same name used in 
     # C GEGL Nodes:
@@ -284,6 +685,7 @@ class Graph(object):
     operation = "meta"
 
     def __init__(self,  *args, **kw):
+        _ensure_init()
         self.auto = True
         if "auto" in kw:
             # disabling "auto" actually has undefined behaviors.
@@ -292,11 +694,7 @@ class Graph(object):
             # as another instance of this class.
             self.auto = kw.pop("auto")
         self._node = _gegl.Node()
-
-        # Anotating this python class in the GIR object, in a circular
-        # reference.
-        # pay attention in object cycles:
-        self._node.container = self
+        _wrappers[hash(self._node)] = self
 
         # ._children is mostly a "bag of nodes" 
         # so that we have an easy reference on the Python side
@@ -320,9 +718,7 @@ class Graph(object):
         else:
             node = OpNode(op, **params)
         self._node.add_child(node._node)
-        # attention: creating cyclic reference:
-        # TODO: use weakrefs
-        node._node._parent_graph = self
+        _parents[hash(node._node)] = self
         return node
         if self.auto and self._children:
             source_node = self
@@ -377,6 +773,11 @@ class Graph(object):
         if isinstance(other, Graph):
             other = other._children[0]
         self._children[-1].connect_to(other, input, output)
+        # The consumer holds this graph, just as OpNode.connect_from
+        # does - the registries only keep weak references to graphs
+        consumer = other if isinstance(other, OpNode) else _wrapper_of(other)
+        if isinstance(consumer, OpNode):
+            consumer._pads[input] = self
 
     def connect_from(self, other, output="output", input="input"):
         if isinstance(other, Graph):
@@ -425,6 +826,39 @@ class Graph(object):
     def __len__(self):
         return len(self._children)
 
+    def close(self):
+        """Releases the native nodes of this graph right away
+
+        Nodes are disconnected and taken out of the graph, and
+        sub-graphs are closed as well, so GEGL can free them
+        (and their caches) without waiting for the Python
+        garbage collector. A closed graph can't be used anymore.
+        Graphs can also be used as context managers:
+        >>> with gegl.Graph("png-load", "invert", "png-save") as graph:
+        ...     graph()
+        """
+        if self._node is None:
+            return
+        for child in self._children:
+            self._node.remove_child(child._node)
+            _parents.pop(hash(child._node), None)
+            if isinstance(child, Graph):
+                child.close()
+                continue
+            for pad in ("input", "aux"):
+                if child.has_pad(pad):
+                    child._node.disconnect(pad)
+            child._pads = {"output": []}
+        self._children = []
+        _wrappers.pop(hash(self._node), None)
+        self._node = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def __repr__(self):
         return self._recursive_repr()
 
@@ -443,10 +877,9 @@ class Graph(object):
                 else:
                     op += "[@%d]" % index
                     index += 1
-                    if hasattr(producer, "_parent_graph"):
-                        aux_graphs.append(producer._parent_graph)
-                    else:
-                        aux_graphs.append(producer)
+                    aux_graph = _parent_of(producer)
+                    aux_graphs.append(producer if aux_graph is None
+                                      else aux_graph)
             parts.append(op)
         result = "Graph(%s)" % ", ".join("%d:%s" % (j, part) 
                     for j, part in enumerate(parts))
@@ -461,42 +894,556 @@ class Graph(object):
 
         return result
 
-    def __call__(self):
+    def __call__(self, optimize=False):
+        if optimize:
+            self.optimize()
         self._children[-1]._node.process()
 
+    def optimize(self):
+        """Folds affine chains, drops no-op nodes and moves crops earlier
+
+        Returns a list of the changes made - see gegl.optimize.optimize
+        """
+        from .optimize import optimize
+        return optimize(self)
+
+    def process_async(self, rect=None, step_budget_ms=10, progress=None):
+        """Coroutine that processes the graph without blocking the event loop
+
+        >>> await graph.process_async(step_budget_ms=5)
+
+        See gegl.aio.process_async
+        """
+        from .aio import process_async
+        return process_async(self, rect, step_budget_ms, progress)
+
+    def profile(self, rect=None):
+        """Renders the graph measuring each node - returns a ProfileReport
+
+        See gegl.profiling.profile
+        """
+        from .profiling import profile
+        return profile(self, rect)
+
+    def _output_node(self):
+        # The last node whose output can be read - skips
+        # sinks such as "png-save" at the end of the graph
+        for child in reversed(self._children):
+            if isinstance(child, Graph):
+                try:
+                    return child._output_node()
+                except ValueError:
+                    continue
+            if child.has_pad("output"):
+                return child
+        raise ValueError("There is no node with an output pad in this graph")
+
+    def render(self, rect, scale=1.0, format="RGBA u8"):
+        """Computes and returns the pixels of the graph output inside rect
+
+        No sink node is needed: the last node with an output pad
+        is rendered, and only the area needed for "rect" is
+        processed. "rect" is given in the coordinates of the
+        zoomed output, just like in Buffer.get -
+        eg. a 256x256 rect at scale 0.5 covers 512x512 unscaled pixels.
+        """
+        if not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        source = _blit_for_scale(self._output_node(), rect, scale, format)
+        return source.buffer.get(rect.rect, scale, format,
+                                 _gegl.AUTO_ROWSTRIDE)
+
+    def render_parallel(self, rect, tiles=None, threads=None,
+                        format="RGBA u8"):
+        """Renders rect using several threads, returning a Buffer
+
+        The area is split in horizontal strips - one per thread - or,
+        if "tiles" is given as a (width, height) size, in tiles
+        aligned to that grid. Each piece is blitted from a thread pool
+        straight into the resulting buffer; pygobject releases the GIL
+        while GEGL is working, so pieces are computed at the same time.
+        """
+        from concurrent import futures
+        if not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        threads = threads or os.cpu_count() or 1
+        target = Buffer(rect, format)
+        if rect.is_empty():
+            return target
+        if tiles is None:
+            strip = max(1, -(-rect.height // threads))
+            pieces = [Rectangle(rect.x, y, rect.width,
+                                min(strip, rect.y + rect.height - y))
+                      for y in range(rect.y, rect.y + rect.height, strip)]
+        else:
+            pieces = list(target.tiles(tiles))
+        node = self._output_node()._node
+
+        def blit(piece):
+            node.blit_buffer(target.buffer, piece.rect, 0,
+                             _gegl.AbyssPolicy.NONE)
+
+        with futures.ThreadPoolExecutor(threads) as executor:
+            # "list" re-raises any exception from the threads
+            list(executor.map(blit, pieces))
+        return target
+
+    def compile(self, params):
+        """Returns a CompiledGraph exposing some node properties as parameters
+
+        params maps each parameter name to a (node index, property name)
+        pair; the index may be a tuple to reach nodes inside sub-graphs:
+        >>> g = gegl.Graph("grid", "rotate", "crop", "png-save")
+        >>> tpl = g.compile(params={"angle": (1, "degrees")})
+        >>> tpl(angle=30)  # sets the property and processes the graph
+        """
+        return CompiledGraph(self, params)
+
     def to_xml(self, path_root="/"):
         return self._children[-1]._node.to_xml(path_root)
 
+    @classmethod
+    def from_xml(cls, xml, path_root="/"):
+        """Creates a Graph from GEGL XML, as produced by "to_xml"
+
+        Nodes feeding "aux" pads are rebuilt as sub-graphs plugged
+        in those pads. Parsed graphs are kept as templates keyed on the
+        XML contents: loading the same XML again skips the parsing
+        and just creates new nodes with the same properties.
+        """
+        key = hashlib.sha1((path_root + "\0" + xml).encode("utf-8")).digest()
+        with _xml_templates_lock:
+            template = _xml_templates.get(key)
+            if template is not None:
+                _xml_templates.move_to_end(key)
+        if template is not None:
+            return cls._from_template(template)
+        graph = cls._from_xml(xml, path_root)
+        with _xml_templates_lock:
+            _xml_templates[key] = graph._template()
+            while len(_xml_templates) > _XML_TEMPLATES_SIZE:
+                _xml_templates.popitem(last=False)
+        return graph
+
+    def _template(self):
+        # A plain description of the graph: one entry per child, either
+        # ("graph", template) for sub-graphs or
+        # ("node", operation, properties, aux template or None)
+        result = []
+        for child in self._children:
+            if isinstance(child, Graph):
+                result.append(("graph", child._template()))
+                continue
+            properties = {}
+            for prop in child.properties:
+                value = child._node.get_property(prop)
+                if value is None:
+                    continue
+                # mutable GEGL objects are not shared between copies
+                if isinstance(value, _gegl.Color):
+                    value = tuple(value.get_rgba())
+                elif isinstance(value, _gegl.Path):
+                    value = value.to_string()
+                properties[prop] = value
+            aux = None
+            if child.has_pad("aux"):
+                producer = child._node.get_producer("aux", None)
+                aux_graph = _parent_of(producer)
+                if isinstance(aux_graph, Graph):
+                    aux = aux_graph._template()
+            result.append(("node", child.operation, properties, aux))
+        return tuple(result)
+
+    @classmethod
+    def _from_template(cls, template):
+        graph = cls()
+        for entry in template:
+            if entry[0] == "graph":
+                graph.append(cls._from_template(entry[1]))
+                continue
+            operation, properties, aux = entry[1:]
+            node = OpNode(operation)
+            node.set(**properties)
+            graph.append(node)
+            if aux is not None:
+                cls._from_template(aux).plug_as_aux(node)
+        return graph
+
+    @classmethod
+    def _from_xml(cls, xml, path_root="/"):
+        # GEGL parses the XML and converts all property values;
+        # the parsed nodes are then copied into a new Graph.
+        # This can be the first GEGL call of a process (eg. in map workers)
+        _ensure_init()
+        root = _gegl.Node.new_from_xml(xml, path_root)
+        children = [child for child in root.get_children()
+                    if not (child.get_property("name") or ""
+                            ).startswith("proxynop")]
+        producers = set()
+        for child in children:
+            for pad in ("input", "aux"):
+                if child.has_pad(pad):
+                    producer = child.get_producer(pad, None)
+                    if producer is not None:
+                        producers.add(id(producer))
+        last_nodes = [child for child in children
+                      if id(child) not in producers]
+        if len(last_nodes) != 1:
+            raise ValueError("The XML does not describe a single graph")
+        return cls._from_raw_chain(last_nodes[0])
+
+    @classmethod
+    def _from_raw_chain(cls, raw_node):
+        # Builds a Graph with copies of raw_node and all nodes upstream of
+        # its input pad. Nodes plugged in aux pads become sub-graphs.
+        chain = []
+        while raw_node is not None:
+            chain.append(raw_node)
+            raw_node = (raw_node.get_producer("input", None)
+                        if raw_node.has_pad("input") else None)
+        graph = cls()
+        for raw_node in reversed(chain):
+            node = OpNode(raw_node.get_property("operation"))
+            for prop in node.properties:
+                node._node.set_property(prop, raw_node.get_property(prop))
+            graph.append(node)
+            if raw_node.has_pad("aux"):
+                producer = raw_node.get_producer("aux", None)
+                if producer is not None:
+                    cls._from_raw_chain(producer).plug_as_aux(node)
+        return graph
+
+    def map(self, param_sets, workers=None, mode="process", ordered=True,
+            path_root="/", rect=None, format="RGBA u8"):
+        """Runs copies of this graph once for each item in param_sets
+
+        Each item maps a node index in the graph to the properties
+        to be set on that node before processing, eg:
+        >>> g = gegl.Graph("png-load", "invert", "png-save")
+        >>> params = ({0: {"path": name}, 2: {"path": "inv-" + name}}
+        ...           for name in names)
+        >>> for index, result in g.map(params, workers=4):
+        ...     if isinstance(result, Exception): print(index, result)
+
+        Each worker parses the graph once from its XML, and builds a
+        fresh copy of it for each item, so no properties set for one item
+        carry over to the next. As sub-graphs
+        would be flattened there, changing the node indexes, graphs
+        with sub-graphs (other than those plugged in aux pads)
+        can't be mapped.
+        mode can be "process" or "thread". Yields (index, result)
+        pairs - in the order of param_sets if "ordered" is True, otherwise
+        as they complete. Without "rect", the graph is processed for its
+        side effects (eg. a "png-save" at the end) and the result is None;
+        with it, the result is the rendered rect, as from Graph.render.
+        If processing fails, the exception is yielded in place of the result.
+        param_sets may be a lazy iterable: only a few items per worker
+        are consumed ahead of the results, counting those finished but
+        waiting on an earlier item to be yielded.
+        """
+        from concurrent import futures
+        if any(isinstance(child, Graph) for child in self._children):
+            raise ValueError("Graphs with sub-graphs can't be mapped - "
+                             "node indexes would not match in the workers")
+        if rect is not None:
+            if not isinstance(rect, Rectangle):
+                rect = Rectangle(rect)
+            # plain data, so it can be sent to worker processes
+            rect = rect.as_sequence()
+        xml = self.to_xml(path_root)
+        workers = workers or os.cpu_count() or 1
+        if mode == "process":
+            import multiprocessing
+            executor = futures.ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_map_worker_init, initargs=(xml, path_root))
+        elif mode == "thread":
+            executor = futures.ThreadPoolExecutor(
+                workers, initializer=_map_worker_init,
+                initargs=(xml, path_root))
+        else:
+            raise ValueError("mode should be 'process' or 'thread'")
+
+        pending = {}
+        finished = {}
+        next_index = 0
+        param_sets = enumerate(param_sets)
+        with executor:
+            while True:
+                while len(pending) + len(finished) < 2 * workers:
+                    item = next(param_sets, None)
+                    if item is None:
+                        break
+                    index, params = item
+                    future = executor.submit(_map_worker_run, params,
+                                             rect, format)
+                    pending[future] = index
+                if not pending:
+                    break
+                done, _ = futures.wait(pending,
+                                       return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    error = future.exception()
+                    finished[index] = (error if error is not None
+                                       else future.result())
+                if not ordered:
+                    for index in sorted(finished):
+                        yield index, finished.pop(index)
+                while next_index in finished:
+                    yield next_index, finished.pop(next_index)
+                    next_index += 1
+
     process = __call__
 
+class CompiledGraph(object):
+    """A Graph with some of its node properties bound to named parameters
+
+    The nodes, property names and value converters for each
+    parameter are looked up once, when the template is created, so
+    changing the parameters is just a property write in the GEGL nodes.
+    Create these with Graph.compile.
+    """
+    def __init__(self, graph, params):
+        self.graph = graph
+        self._setters = {}
+        for name, (index, prop) in params.items():
+            node = graph
+            for i in (index if isinstance(index, tuple) else (index,)):
+                node = node[i]
+            prop = prop.replace("_", "-")
+            if not prop in node.properties:
+                raise KeyError("%s not a property for %s" %
+                               (prop, node.operation))
+            self._setters[name] = (node._node.set_property, prop,
+                                   node._schema.codecs[prop])
+
+    @property
+    def params(self):
+        return sorted(self._setters)
+
+    def bind(self, **kwargs):
+        """Sets parameter values without processing the graph"""
+        setters = self._setters
+        for name, value in kwargs.items():
+            set_property, prop, codec = setters[name]
+            if codec is not None:
+                value = codec(value)
+            set_property(prop, value)
+
+    def __call__(self, **kwargs):
+        self.bind(**kwargs)
+        return self.graph()
+
+    def render(self, rect, scale=1.0, format="RGBA u8", **kwargs):
+        self.bind(**kwargs)
+        return self.graph.render(rect, scale, format)
+
+    def __repr__(self):
+        return "CompiledGraph(%s)" % ", ".join(self.params)
+
+
+class Processor(object):
+    """Renders a Graph or OpNode a piece at a time
+
+    Wraps GEGL's GeglProcessor so that rendering can be spread over
+    several GUI frames or server ticks:
+    >>> processor = gegl.Processor(graph, (0, 0, 640, 480))
+    >>> while not processor.is_done:
+    ...     processor.work(budget_ms=10)
+
+    For a Graph the last node is processed - a sink, such as
+    "png-save", is written when all of its input is ready.
+    The region of interest can be changed at any time by assigning
+    to "rect".
+    """
+    def __init__(self, target, rect=None):
+        if isinstance(target, Graph):
+            target = target._children[-1]
+        self.node = target
+        if rect is not None and not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        self._rect = rect
+        self._processor = target._node.new_processor(
+            rect.rect if rect is not None else None)
+        self.progress = 0.0
+        self.is_done = False
+
+    def _get_rect(self):
+        return self._rect
+
+    def _set_rect(self, rect):
+        if not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        self._rect = rect
+        self._processor.set_rectangle(rect.rect)
+        self.is_done = False
+
+    rect = property(_get_rect, _set_rect)
+
+    def work(self, budget_ms=None):
+        """Processes chunks until budget_ms is used up, or a single
+        chunk if no budget is given. Returns the progress, from 0 to 1
+        """
+        deadline = (time.perf_counter() + budget_ms / 1000.0
+                    if budget_ms is not None else None)
+        while not self.is_done:
+            more, self.progress = self._processor.work()
+            if not more:
+                self.is_done = True
+                self.progress = 1.0
+            if deadline is None or time.perf_counter() >= deadline:
+                break
+        return self.progress
+
+    def run(self):
+        """Processes everything that is left"""
+        while not self.is_done:
+            self.work()
+
+    def get_buffer(self):
+        """Returns a Buffer with the results rendered so far"""
+        return Buffer(self._processor.get_buffer())
+
+    def __repr__(self):
+        return "Processor(%s, %s, progress=%.2f)" % (
+            self.node.operation, self._rect, self.progress)
+
+
+# GEGL keeps this many mipmap levels below the full resolution
+_MIPMAP_LEVELS = 8
+
+def _level_for_scale(scale):
+    # The mipmap level holding pixels at "scale", as gegl_level_from_scale,
+    # for scales 1/2, 1/4...; 0 (full resolution) for any other scale
+    level = 0
+    while scale < 1 and level < _MIPMAP_LEVELS:
+        scale *= 2
+        level += 1
+    return level if scale == 1 else 0
+
+def _blit_for_scale(node, rect, scale, format):
+    # Renders the node output under rect - given in zoomed coordinates,
+    # as in Buffer.get - into a new Buffer, ready to be read back with
+    # "scale". For power of two scales GEGL computes the matching
+    # mipmap level directly, rather than every full resolution pixel.
+    if scale == 1:
+        source_rect = rect
+    else:
+        x0 = int(math.floor(rect.x / scale))
+        y0 = int(math.floor(rect.y / scale))
+        x1 = int(math.ceil((rect.x + rect.width) / scale))
+        y1 = int(math.ceil((rect.y + rect.height) / scale))
+        source_rect = Rectangle(x0, y0, x1 - x0, y1 - y0)
+    source = Buffer(source_rect, format)
+    node._node.blit_buffer(source.buffer, source_rect.rect,
+                           _level_for_scale(scale), _gegl.AbyssPolicy.NONE)
+    return source
+
+
+# Graph templates parsed by Graph.from_xml, keyed by a hash of the XML
+_XML_TEMPLATES_SIZE = 128
+_xml_templates = OrderedDict()
+_xml_templates_lock = threading.Lock()
+
+# Each "Graph.map" worker keeps the template of the graph, and builds
+# a new copy of it for each item
+_map_worker_state = threading.local()
+
+def _map_worker_init(xml, path_root):
+    _map_worker_state.template = Graph.from_xml(xml, path_root)._template()
+
+def _map_worker_run(params, rect=None, format="RGBA u8"):
+    with Graph._from_template(_map_worker_state.template) as graph:
+        for index, properties in params.items():
+            graph[index].set(**properties)
+        if rect is None:
+            graph()
+            return None
+        return graph.render(rect, 1.0, format)
+
+
+# Bounded cache of parsed color strings - maps each string to its RGBA tuple
+_COLOR_CACHE_SIZE = 1024
+_color_cache = OrderedDict()
+_color_cache_lock = threading.Lock()
+
+def _parse_color(text):
+    with _color_cache_lock:
+        try:
+            rgba = _color_cache[text]
+        except KeyError:
+            pass
+        else:
+            _color_cache.move_to_end(text)
+            return rgba
+    _ensure_init()
+    rgba = tuple(_gegl.Color.new(text).get_rgba())
+    with _color_cache_lock:
+        _color_cache[text] = rgba
+        while len(_color_cache) > _COLOR_CACHE_SIZE:
+            _color_cache.popitem(last=False)
+    return rgba
+
+
 class Color(object):
+    """Wrapper for GEGL colors
+
+    The RGBA components of colors created in Python are kept on the
+    Python side, so reading them doesn't call into GEGL; the native
+    GeglColor is only created when the color is handed to GEGL, and is
+    kept in sync afterwards. Wrapped native colors (as the values of
+    node properties) are read from GEGL each time, so that changes made
+    elsewhere show up. Color strings (as in "#ff8000" or "red")
+    are parsed once and cached.
+    """
     def __init__(self, r=1, g=1, b=1, a=1):
+        self._native = None
+        # None while wrapping a native color
+        self._values = None
         if isinstance(r, _gegl.Color):
-            self._color = r
+            self._native = r
             return
         if isinstance(r, str):
-            self._color = _gegl.Color.new(r)
+            self._values = _parse_color(r)
             return
-        self._color = _gegl.Color()
         if hasattr(r, "__len__"):
             if len(r) == 3:
                 r,g,b = r
                 a = 1.0
             elif len(r) == 4:
               r, g, b, a = r  
-        self.set_rgba(r, g, b, a)
+        self._values = (r, g, b, a)
+
+    @property
+    def _rgba(self):
+        if self._values is None:
+            return tuple(self._native.get_rgba())
+        return self._values
+
+    @property
+    def _color(self):
+        if self._native is None:
+            _ensure_init()
+            color = _gegl.Color()
+            color.set_rgba(*self._rgba)
+            self._native = color
+        return self._native
 
     def set_rgba(self,r ,g ,b ,a):
-        self._color.set_rgba(r,g,b,a)
+        if self._values is not None:
+            self._values = (r, g, b, a)
+        if self._native is not None:
+            self._native.set_rgba(r,g,b,a)
 
     def get_rgba(self):
-        return self._color.get_rgba()
+        return self._rgba
 
     def __getitem__(self, index):
-        return self.get_rgba()[index]
+        return self._rgba[index]
 
     def __setitem__(self, index, value):
-        color = list(self.get_rgba())
+        color = list(self._rgba)
         color[index] = value
         self.set_rgba(*color)
 
@@ -505,13 +1452,13 @@ class Color(object):
     def set_rgb(self, r,g,b):
         self.set_rgba(r,g,b,self.a)
 
-    r = red = property(lambda s:s.get_rgba()[0], lambda s,v: s.__setitem__(0,v))
-    g = green = property(lambda s:s.get_rgba()[1], lambda s,v: s.__setitem__(1,v))
-    b = blue = property(lambda s:s.get_rgba()[2], lambda s,v: s.__setitem__(2,v))
-    a = alpha = property(lambda s:s.get_rgba()[3], lambda s,v: s.__setitem__(3,v))
+    r = red = property(lambda s:s._rgba[0], lambda s,v: s.__setitem__(0,v))
+    g = green = property(lambda s:s._rgba[1], lambda s,v: s.__setitem__(1,v))
+    b = blue = property(lambda s:s._rgba[2], lambda s,v: s.__setitem__(2,v))
+    a = alpha = property(lambda s:s._rgba[3], lambda s,v: s.__setitem__(3,v))
 
     def __repr__(self):
-        return "Color%s" % str(tuple(self))
+        return "Color%s" % str(tuple(self._rgba))
 
     def __eq__(self, other):
         try:
@@ -519,7 +1466,7 @@ class Color(object):
                 return False
         except TypeError:
             return False
-        for item in zip(self, other):
+        for item in zip(self._rgba, other):
             if item[0] != item[1]:
                 return False
         return True
@@ -537,7 +1484,11 @@ class Buffer(object):
     These buffers are ok to be on used with the 
     "gegl:write-buffer" operation
     """
+    # The BufferPool this buffer was acquired from, while in use
+    _pool = None
+
     def __init__(self, rect, format="RGBA u8"):
+        _ensure_init()
         if isinstance(rect, _gegl.Buffer):
             self.buffer = rect
             # gegl's gegl_buffer_{get,set}_format 
@@ -575,8 +1526,300 @@ class Buffer(object):
     def get_extent(self):
         return Rectangle(self.buffer.get_extent())
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        # Buffers from a BufferPool go back to it
+        if self._pool is not None:
+            self._pool.release(self)
+
+    def to_array(self, rect=None, format=None, out=None):
+        """Retrieves the pixels in rect as a numpy array
+
+        The array is shaped (height, width, components), with the dtype
+        matching the babl format. GEGL always copies the pixels out of
+        its tiles into a new bytes object; without "out" the result is a
+        read-only view over it. "out" is a convenience to fill an existing
+        array (any strides, including padded rows, are fine) - the
+        pixels are then copied once more into it, so it doesn't
+        save any memory traffic.
+        """
+        _require_numpy()
+        if rect is None:
+            rect = self.get_extent()
+        elif not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        if format is None:
+            format = self.format
+        components, dtype = _format_layout(format)
+        data = self.buffer.get(rect.rect, 1.0, format, _gegl.AUTO_ROWSTRIDE)
+        view = numpy.frombuffer(data, dtype=dtype).reshape(
+            rect.height, rect.width, components)
+        if out is None:
+            return view
+        if out.shape != view.shape:
+            raise ValueError("Output array should have shape %s, not %s" %
+                             (view.shape, out.shape))
+        out[...] = view
+        return out
+
+    def set_array(self, arr, rect=None, format=None):
+        """Writes the pixels of a numpy array shaped (height, width[, components])
+
+        pygobject only hands "bytes" objects to GEGL, so the pixels are
+        always copied once at that boundary - and once more before that
+        if the array is not C-contiguous or its dtype does not match
+        the format. Rows are always passed packed; there is no rowstride.
+        """
+        _require_numpy()
+        if format is None:
+            format = self.format
+        components, dtype = _format_layout(format)
+        if rect is None:
+            extent = self.get_extent()
+            rect = Rectangle(extent.x, extent.y, arr.shape[1], arr.shape[0])
+        elif not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        if arr.ndim == 2 and components == 1:
+            arr = arr.reshape(arr.shape + (1,))
+        expected = (rect.height, rect.width, components)
+        if arr.shape != expected:
+            raise ValueError("Array should have shape %s for %s, not %s" %
+                             (expected, rect, arr.shape))
+        arr = numpy.ascontiguousarray(arr, dtype=dtype)
+        # pygobject only takes the fast path for "bytes" objects
+        self.buffer.set(rect.rect, format, arr.tobytes())
+
+    def tiles(self, tile_size=(256, 256)):
+        """Yields Rectangles covering the buffer extent
+
+        Tiles are aligned to a grid with the given size
+        starting at the origin - as GEGL's own tile grid is -
+        and clipped to the buffer extent.
+        """
+        tile_width, tile_height = tile_size
+        x, y, width, height = self.get_extent().as_sequence()
+        for top in range(y // tile_height * tile_height, y + height,
+                         tile_height):
+            for left in range(x // tile_width * tile_width, x + width,
+                              tile_width):
+                x0, y0 = max(left, x), max(top, y)
+                x1 = min(left + tile_width, x + width)
+                y1 = min(top + tile_height, y + height)
+                yield Rectangle(x0, y0, x1 - x0, y1 - y0)
+
+    def iter_tiles(self, tile_size=(256, 256), format=None, overlap=0):
+        """Walks the buffer one tile at a time, yielding (Rectangle, array)
+
+        Only one tile is read at a time, so memory use depends on
+        the tile size, not on the buffer size. With "overlap" the array
+        also holds that many pixels around the tile on each side
+        (pixels outside the buffer are transparent) - the tile itself
+        is then at array[overlap:-overlap, overlap:-overlap].
+        """
+        for rect in self.tiles(tile_size):
+            yield rect, self.to_array(self._grow(rect, overlap), format)
+
+    def write_tiles(self, tile_size=(256, 256), format=None, overlap=0):
+        """Like iter_tiles, but yields writable arrays
+
+        Whatever is in each array when the next tile is requested is
+        written back to the buffer - only the tile area, not the overlap.
+        The last tile is written back as well when the loop is left
+        early, with "break".
+        """
+        _require_numpy()
+        components, dtype = _format_layout(format or self.format)
+        for rect in self.tiles(tile_size):
+            grown = self._grow(rect, overlap)
+            arr = numpy.empty((grown.height, grown.width, components), dtype)
+            tile = self.to_array(grown, format, out=arr)
+            try:
+                yield rect, tile
+            finally:
+                self.set_array(arr[overlap:overlap + rect.height,
+                                   overlap:overlap + rect.width],
+                               rect, format)
+
+    @staticmethod
+    def _grow(rect, amount):
+        if not amount:
+            return rect
+        return Rectangle(rect.x - amount, rect.y - amount,
+                         rect.width + 2 * amount, rect.height + 2 * amount)
+
+    @classmethod
+    def from_array(cls, arr, rect=None, format=None):
+        """Creates a new Buffer with the contents of a numpy array
+
+        If format is not given, it is guessed from the array
+        shape and dtype - a (480, 640, 4) uint8 array becomes "RGBA u8".
+        """
+        _require_numpy()
+        if format is None:
+            format = _format_from_array(arr)
+        if rect is None:
+            rect = (0, 0, arr.shape[1], arr.shape[0])
+        self = cls(rect, format)
+        self.set_array(arr, self.rect, format)
+        return self
+
+    @classmethod
+    def open(cls, path, format="RGBA u8"):
+        """Opens a buffer file, as written by GEGL, without loading it
+
+        Tiles are read from (and written to) the file as they are
+        needed, so the buffer may be larger than the available memory.
+        The format is the one used by default when reading
+        and writing pixels - the file keeps its own.
+        """
+        _ensure_init()
+        return cls(_gegl.Buffer.open(path), format)
+
+    @classmethod
+    def create_file(cls, path, rect, format="RGBA u8"):
+        """Creates an empty buffer file covering rect and opens it"""
+        _ensure_init()
+        if not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        _gegl.Buffer.new(format, *rect.as_sequence()).save(path, rect.rect)
+        self = cls.open(path, format)
+        self.rect = rect
+        return self
+
+    @classmethod
+    def from_mmap(cls, path, rect, format="RGBA u8", offset=0,
+                  rowstride=None):
+        """Creates a buffer over the raw pixels of a memory-mapped file
+
+        The file holds rows of "rowstride" bytes (by default, just the
+        pixels of one row) starting at "offset". They are streamed
+        into the buffer a strip at a time, so the whole image never
+        has to fit in memory - GEGL pages tiles to its swap as needed.
+        After the file changes, call invalidate(rect) to reload that
+        area; flush(rect) writes changes made through GEGL back to the file.
+        """
+        try:
+            with open(path, "r+b") as file_:
+                mapped = mmap.mmap(file_.fileno(), 0)
+        except PermissionError:
+            # read-only files can still be used, but not flushed to
+            with open(path, "rb") as file_:
+                mapped = mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls._from_memory(mapped, rect, format, offset, rowstride)
+
+    @classmethod
+    def wrap(cls, obj, rect=None, format=None, rowstride=None):
+        """Creates a buffer from a bytearray, numpy array, memoryview...
+
+        The pixels are copied into the buffer - GEGL can't use Python
+        memory in place - and the object is kept alive, as the buffer
+        stays tied to it: after writing to the object, call
+        invalidate(rect) to copy that area in again, and flush(rect)
+        to copy changes made through GEGL back into the object.
+        Any object supporting the buffer protocol with C-contiguous memory
+        can be used, with rows "rowstride" bytes apart. For numpy arrays
+        rect, format and rowstride come from the array shape, dtype and
+        strides, so slices of larger arrays work as long as their
+        rows are contiguous.
+        >>> frame = numpy.zeros((480, 640, 4), "uint8")
+        >>> buffer = gegl.Buffer.wrap(frame[:, 100:200])
+        >>> frame[10:20] = 255
+        >>> buffer.invalidate((0, 10, 100, 10))
+        """
+        if _is_array(obj):
+            _require_numpy()
+            if format is None:
+                format = _format_from_array(obj)
+            if rect is None:
+                rect = (0, 0, obj.shape[1], obj.shape[0])
+            obj, rowstride = _array_rows(obj, rowstride)
+        if rect is None or format is None:
+            raise ValueError("rect and format are needed to wrap %s objects" %
+                             type(obj).__name__)
+        return cls._from_memory(obj, rect, format, 0, rowstride)
+
+    @classmethod
+    def _from_memory(cls, obj, rect, format, offset=0, rowstride=None):
+        # A Buffer mirroring pixels kept in a buffer-protocol object
+        if not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        row_bytes = rect.width * _bytes_per_pixel(format)
+        if rowstride is None:
+            rowstride = row_bytes
+        if rowstride < row_bytes:
+            raise ValueError("rowstride should be at least %d for %s" %
+                             (row_bytes, rect))
+        try:
+            view = memoryview(obj).cast("B")
+        except TypeError:
+            raise ValueError("Only C-contiguous memory can be used "
+                             "in a Buffer")
+        needed = offset + rowstride * (rect.height - 1) + row_bytes
+        if rect.height and len(view) < needed:
+            raise ValueError("%d bytes are needed for %s in %s, found %d" %
+                             (needed, rect, format, len(view)))
+        self = cls(rect, format)
+        # keeps the object alive for as long as the buffer
+        self._memory = (obj, view, offset, rowstride)
+        self.invalidate()
+        return self
+
+    def _memory_rows(self, rect):
+        # Splits rect in strips, yielding (strip, view, slices) - slices
+        # are the positions of each row of the strip in the memory view
+        if getattr(self, "_memory", None) is None:
+            raise ValueError("This buffer does not wrap Python memory")
+        obj, view, offset, rowstride = self._memory
+        if rect is None:
+            rect = self.rect
+        elif not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        bpp = _bytes_per_pixel(self.format)
+        x0 = max(rect.x, self.rect.x)
+        y0 = max(rect.y, self.rect.y)
+        x1 = min(rect.x + rect.width, self.rect.x + self.rect.width)
+        y1 = min(rect.y + rect.height, self.rect.y + self.rect.height)
+        if x1 <= x0 or y1 <= y0:
+            return
+        row_bytes = (x1 - x0) * bpp
+        strip_height = max(1, _STRIP_BYTES // row_bytes)
+        for top in range(y0, y1, strip_height):
+            bottom = min(top + strip_height, y1)
+            slices = []
+            for y in range(top, bottom):
+                start = (offset + (y - self.rect.y) * rowstride +
+                         (x0 - self.rect.x) * bpp)
+                slices.append(slice(start, start + row_bytes))
+            yield Rectangle(x0, top, x1 - x0, bottom - top), view, slices
+
+    def invalidate(self, rect=None):
+        """Reloads rect (by default, everything) from the wrapped memory"""
+        for strip, view, slices in self._memory_rows(rect):
+            if slices[-1].stop - slices[0].start == (
+                    len(slices) * (slices[0].stop - slices[0].start)):
+                data = view[slices[0].start:slices[-1].stop].tobytes()
+            else:
+                data = b"".join(view[rows].tobytes() for rows in slices)
+            self.buffer.set(strip.rect, self.format, data)
+
+    def flush(self, rect=None):
+        """Writes rect (by default, everything) back to the wrapped memory"""
+        for strip, view, slices in self._memory_rows(rect):
+            data = self.buffer.get(strip.rect, 1.0, self.format,
+                                   _gegl.AUTO_ROWSTRIDE)
+            row_bytes = slices[0].stop - slices[0].start
+            for i, rows in enumerate(slices):
+                view[rows] = data[i * row_bytes:(i + 1) * row_bytes]
+
 
 class Rectangle(object):
+    # Coordinates are kept as plain Python ints until a native
+    # rectangle is needed (or given) - from then on the native
+    # rectangle holds them, so changes made to it show up here
+    __slots__ = ("_x", "_y", "_width", "_height", "_rect")
+
     def __init__(self, multi=0, y=0, width=640, height=480):
         """
         Creates a gegl Rectangle Object 
@@ -590,16 +1833,15 @@ class Rectangle(object):
         
         The native gir gegl.Rectangle is public at the .rect attribute
         """
-        #self.rect = _gegl.Rect()
+        self._rect = None
         if isinstance(multi, Buffer):
             multi = multi.buffer
         if isinstance(multi, _gegl.Buffer):
-            self.rect = multi.get_extent()
-            return
-        elif isinstance(multi, _gegl.Rectangle):
+            multi = multi.get_extent()
+        if isinstance(multi, _gegl.Rectangle):
             # just wrap it:
-            self.rect = multi
-            return
+            self._rect = multi
+            x, y, width, height = multi.x, multi.y, multi.width, multi.height
         elif isinstance(multi, Rectangle):
             x, y, width, height = multi.as_sequence()
         else:
@@ -615,33 +1857,127 @@ class Rectangle(object):
                 x = multi
             else:
                 x = y = 0
-        self.rect = _gegl.Rectangle()
-        self.x = x
-        self.y = y
-        self.width = width
-        self.height = height
-
-    x = property(lambda s: s.rect.x,
-                 lambda s,v: setattr(s.rect, "x", v))
-    y = property(lambda s: s.rect.y,
-                 lambda s,v: setattr(s.rect, "y", v))
-    width = property(lambda s: s.rect.width,
-                     lambda s,v: setattr(s.rect, "width", v))
-    height = property(lambda s: s.rect.height,
-                      lambda s,v: setattr(s.rect, "height", v))
+        self._x = int(x)
+        self._y = int(y)
+        self._width = int(width)
+        self._height = int(height)
+
+    @property
+    def rect(self):
+        if self._rect is None:
+            rect = _gegl.Rectangle()
+            rect.x, rect.y = self._x, self._y
+            rect.width, rect.height = self._width, self._height
+            self._rect = rect
+        return self._rect
+
+    def _get(self, attr):
+        if self._rect is not None:
+            return getattr(self._rect, attr)
+        return object.__getattribute__(self, "_" + attr)
+
+    def _set(self, attr, value):
+        value = int(value)
+        if self._rect is not None:
+            setattr(self._rect, attr, value)
+        else:
+            object.__setattr__(self, "_" + attr, value)
+
+    x = property(lambda s: s._get("x"),
+                 lambda s,v: s._set("x", v))
+    y = property(lambda s: s._get("y"),
+                 lambda s,v: s._set("y", v))
+    width = property(lambda s: s._get("width"),
+                     lambda s,v: s._set("width", v))
+    height = property(lambda s: s._get("height"),
+                      lambda s,v: s._set("height", v))
 
     def as_sequence(self):
-        return self.x, self.y, self.width, self.height
+        rect = self._rect
+        if rect is not None:
+            return rect.x, rect.y, rect.width, rect.height
+        return self._x, self._y, self._width, self._height
+
+    def intersection(self, other):
+        """Returns the area common to both rectangles
+
+        If they don't overlap the result has no width and height.
+        """
+        if not isinstance(other, Rectangle):
+            other = Rectangle(other)
+        x0, y0 = max(self.x, other.x), max(self.y, other.y)
+        x1 = min(self.x + self.width, other.x + other.width)
+        y1 = min(self.y + self.height, other.y + other.height)
+        return Rectangle(x0, y0, max(0, x1 - x0), max(0, y1 - y0))
+
+    def union(self, other):
+        """Returns the smallest rectangle holding both rectangles
+
+        Empty rectangles are left out.
+        """
+        if not isinstance(other, Rectangle):
+            other = Rectangle(other)
+        if self.is_empty():
+            return Rectangle(*other.as_sequence())
+        if other.is_empty():
+            return Rectangle(*self.as_sequence())
+        x0, y0 = min(self.x, other.x), min(self.y, other.y)
+        x1 = max(self.x + self.width, other.x + other.width)
+        y1 = max(self.y + self.height, other.y + other.height)
+        return Rectangle(x0, y0, x1 - x0, y1 - y0)
+
+    def contains(self, other):
+        """Tells whether other lies entirely inside this rectangle"""
+        if not isinstance(other, Rectangle):
+            other = Rectangle(other)
+        return (self.x <= other.x and self.y <= other.y and
+                self.x + self.width >= other.x + other.width and
+                self.y + self.height >= other.y + other.height)
+
+    def is_empty(self):
+        return self.width <= 0 or self.height <= 0
+
+    def __eq__(self, other):
+        if isinstance(other, (Rectangle, _gegl.Rectangle)):
+            other = Rectangle(other)
+            return self.as_sequence() == other.as_sequence()
+        try:
+            return self.as_sequence() == tuple(other)
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.as_sequence())
 
     def __repr__(self):
-        return "Rectangle%s" % self.as_sequence()
+        return "Rectangle%s" % (self.as_sequence(),)
+
+
+# Transparently make available all remaining GEGL calls.
+# They are looked up on first access, so that importing
+# this module doesn't introspect the whole GEGL typelib:
+
+_RAW_EXCLUDED = ("LookupFunction", "NodeFunction", "TileCallback")
 
+def __getattr__(name):
+    if name.startswith("_") or name in _RAW_EXCLUDED:
+        raise AttributeError("module %r has no attribute %r" %
+                             (__name__, name))
+    try:
+        value = getattr(_gegl, name)
+    except AttributeError:
+        raise AttributeError("module %r has no attribute %r" %
+                             (__name__, name))
+    _ensure_init()
+    globals()[name] = value
+    return value
 
-# Transparently make available all remaining GEGL calls:
+def __dir__():
+    return sorted(set(globals()) | set(
+        key for key in dir(_gegl)
+        if not key.startswith("_") and key not in _RAW_EXCLUDED))
 
-for key in dir(_gegl):
-    if key.startswith("_"): continue
-    if key in ("LookupFunction", "NodeFunction", "TileCallback"): continue
-    if key not in globals():
-        globals()[key] = getattr(_gegl, key)
 
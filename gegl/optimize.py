@@ -0,0 +1,370 @@
+# coding: utf-8
+
+"""
+Graph rewriting passes that remove duplicated or useless work.
+"""
+
+import math
+import re
+from collections import namedtuple
+
+from .gegl import Graph, OpNode, Rectangle
+from .gegl import _parent_of, _parents, _plain_value, _walk, schemas
+from .cache import fingerprint, _value_key, _wrap
+
+
+def _rewire(consumer, pad, old, new):
+    # Moves the consumer pad from the old producer to the new one,
+    # keeping the Python side bookkeeping of both in sync
+    outputs = old.__dict__.get("_pads", {}).get("output", [])
+    parent = consumer._parent_graph
+    for i, item in enumerate(outputs):
+        if item is consumer or item is parent:
+            del outputs[i]
+            break
+    consumer.connect_from(new, input=pad)
+
+def share(graphs):
+    """Makes identical upstream work in several graphs be computed once
+
+    Nodes with the same operation, the same property values and
+    equivalent producers (compared as in OpNode.__eq__, all the way up)
+    are detected across all graphs. Every consumer of a duplicate
+    is connected to the first equivalent node found instead, so
+    GEGL computes the result once and feeds all consumers.
+    eg.:
+    >>> g1 = gegl.Graph(("png-load", {"path": "a.png"}), "invert", "png-save")
+    >>> g2 = gegl.Graph(("png-load", {"path": "a.png"}), "blur", "png-save")
+    >>> gegl.share([g1, g2])  # g2's "blur" now reads from g1's "png-load"
+
+    The duplicated nodes are kept in their graphs, but nothing reads
+    from them anymore. Returns a list of (duplicate, shared) OpNode pairs.
+    """
+    if isinstance(graphs, Graph):
+        graphs = [graphs]
+    memo = {}
+    canonical = {}
+    merged = []
+    seen = set()
+    for graph in graphs:
+        for consumer in list(_walk(graph, seen)):
+            for pad in ("input", "aux"):
+                if not consumer.has_pad(pad):
+                    continue
+                raw_producer = consumer._node.get_producer(pad, None)
+                if raw_producer is None:
+                    continue
+                producer = _wrap(raw_producer)
+                key = fingerprint(producer, memo)
+                shared = canonical.setdefault(key, producer)
+                if shared._node is raw_producer:
+                    continue
+                _rewire(consumer, pad, producer, shared)
+                merged.append((producer, shared))
+    return merged
+
+
+Change = namedtuple("Change", "action nodes target")
+Change.__doc__ = """One rewrite done by optimize
+
+action is one of "fold", "drop" or "move" and nodes are the OpNodes
+affected. target is the "transform" node replacing folded nodes,
+the node a crop was moved in front of, or None for dropped nodes.
+"""
+
+# Pixel-wise operations: cropping before or after them gives the same result
+POINT_OPERATIONS = {
+    "gegl:brightness-contrast", "gegl:color-temperature", "gegl:exposure",
+    "gegl:gamma", "gegl:grey", "gegl:hue-chroma", "gegl:invert",
+    "gegl:invert-gamma", "gegl:invert-linear", "gegl:levels",
+    "gegl:mono-mixer", "gegl:channel-mixer", "gegl:posterize",
+    "gegl:rgb-clip", "gegl:saturation", "gegl:sepia", "gegl:threshold",
+    "gegl:value-invert", "gegl:color-to-alpha",
+}
+
+# Properties describing the geometry of each affine operation
+_AFFINE_GEOMETRY = {
+    "gegl:rotate": ("degrees", "origin-x", "origin-y"),
+    "gegl:scale-ratio": ("x", "y", "origin-x", "origin-y"),
+    "gegl:translate": ("x", "y", "origin-x", "origin-y"),
+    "gegl:transform": ("transform", "origin-x", "origin-y"),
+}
+
+# Properties the folded "gegl:transform" carries over - they must match
+# for nodes to be folded. Other properties only some of the operations
+# have (eg. "abyss-policy") must be left at their defaults.
+_AFFINE_SETTINGS = ("sampler", "near-z")
+
+_IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+_MATRIX = re.compile(r"^\s*matrix\s*\(([^)]*)\)\s*$")
+
+
+def _multiply(m2, m1):
+    # Matrices as SVG (a, b, c, d, e, f) tuples - the result
+    # applies m1 first, then m2
+    a2, b2, c2, d2, e2, f2 = m2
+    a1, b1, c1, d1, e1, f1 = m1
+    return (a2 * a1 + c2 * b1, b2 * a1 + d2 * b1,
+            a2 * c1 + c2 * d1, b2 * c1 + d2 * d1,
+            a2 * e1 + c2 * f1 + e2, b2 * e1 + d2 * f1 + f2)
+
+def _affine_matrix(node):
+    # The matrix applied by an affine node, or None
+    # if it can't be worked out
+    operation = node.operation
+    if operation == "gegl:rotate":
+        radians = math.radians(node["degrees"])
+        cos, sin = math.cos(radians), math.sin(radians)
+        matrix = (cos, -sin, sin, cos, 0.0, 0.0)
+    elif operation == "gegl:scale-ratio":
+        matrix = (node["x"], 0.0, 0.0, node["y"], 0.0, 0.0)
+    elif operation == "gegl:translate":
+        matrix = (1.0, 0.0, 0.0, 1.0, node["x"], node["y"])
+    elif operation == "gegl:transform":
+        text = node["transform"] or ""
+        if not text.strip():
+            matrix = _IDENTITY
+        else:
+            match = _MATRIX.match(text)
+            if not match:
+                return None
+            try:
+                matrix = tuple(float(value) for value in
+                               match.group(1).replace(",", " ").split())
+            except ValueError:
+                return None
+            if len(matrix) != 6:
+                return None
+    else:
+        return None
+    origin_x = node["origin-x"] if "origin-x" in node.properties else 0
+    origin_y = node["origin-y"] if "origin-y" in node.properties else 0
+    if origin_x or origin_y:
+        matrix = _multiply((1.0, 0.0, 0.0, 1.0, origin_x, origin_y),
+                           _multiply(matrix,
+                                     (1.0, 0.0, 0.0, 1.0, -origin_x, -origin_y)))
+    return matrix
+
+def _is_identity(matrix):
+    return all(abs(value - identity) < 1e-9
+               for value, identity in zip(matrix, _IDENTITY))
+
+def _affine_settings(node):
+    # The properties of an affine node carried over when folding it,
+    # as a comparable key - or None if it can't be folded
+    geometry = _AFFINE_GEOMETRY[node.operation]
+    defaults = schemas[node.operation].defaults
+    settings = []
+    for prop in sorted(node.properties):
+        if prop in _AFFINE_SETTINGS:
+            settings.append((prop, _value_key(node[prop])))
+        elif prop not in geometry and (
+                _plain_value(node._node.get_property(prop)) !=
+                defaults.get(prop)):
+            return None
+    return tuple(settings)
+
+def _consumers(node):
+    return node.__dict__.get("_pads", {}).get("output", [])
+
+def _movable(chain, index):
+    # A node can be taken out of the chain if nothing besides
+    # the next node in the chain reads from it
+    node = chain[index]
+    if not isinstance(node, OpNode):
+        return False
+    following = chain[index + 1] if index + 1 < len(chain) else None
+    return all(consumer is following for consumer in _consumers(node))
+
+def _has_aux(node):
+    return (node.has_pad("aux") and
+            node._node.get_producer("aux", None) is not None)
+
+def _fold_affine(chain, changes):
+    result = []
+    index = 0
+    while index < len(chain):
+        node = chain[index]
+        run = []
+        if index > 0 and isinstance(node, OpNode):
+            settings = None
+            while index + len(run) < len(chain):
+                candidate = chain[index + len(run)]
+                if (not isinstance(candidate, OpNode) or
+                        candidate.operation not in _AFFINE_GEOMETRY or
+                        not _movable(chain, index + len(run)) or
+                        _affine_matrix(candidate) is None):
+                    break
+                candidate_settings = _affine_settings(candidate)
+                if candidate_settings is None:
+                    break
+                if settings is None:
+                    settings = candidate_settings
+                elif candidate_settings != settings:
+                    break
+                run.append(candidate)
+        if len(run) < 2:
+            result.append(node)
+            index += 1
+            continue
+        matrix = _IDENTITY
+        for affine in run:
+            matrix = _multiply(_affine_matrix(affine), matrix)
+        folded = OpNode("gegl:transform", transform="matrix(%s)" %
+                        ",".join(repr(value) for value in matrix))
+        folded.set(**{prop: run[0][prop] for prop in _AFFINE_SETTINGS
+                      if prop in run[0].properties and
+                      prop in folded.properties})
+        changes.append(Change("fold", run, folded))
+        result.append(folded)
+        index += len(run)
+    return result
+
+def _input_bounds(node):
+    producer = node._node.get_producer("input", None)
+    if producer is None:
+        return None
+    return Rectangle(producer.get_bounding_box())
+
+def _is_noop(node):
+    operation = node.operation
+    if operation == "gegl:nop":
+        return True
+    elif operation == "gegl:opacity":
+        return node["value"] == 1.0 and not _has_aux(node)
+    elif operation == "gegl:gaussian-blur":
+        return node["std-dev-x"] == 0 and node["std-dev-y"] == 0
+    elif operation == "gegl:box-blur":
+        return node["radius"] == 0
+    elif operation in _AFFINE_GEOMETRY:
+        matrix = _affine_matrix(node)
+        return matrix is not None and _is_identity(matrix)
+    elif operation == "gegl:crop":
+        if _has_aux(node) or "reset-origin" in node.properties and \
+                node["reset-origin"]:
+            return False
+        bounds = _input_bounds(node)
+        if bounds is None or node["width"] <= 0 or node["height"] <= 0:
+            return False
+        return (node["x"] <= bounds.x and node["y"] <= bounds.y and
+                node["x"] + node["width"] >= bounds.x + bounds.width and
+                node["y"] + node["height"] >= bounds.y + bounds.height)
+    return False
+
+def _drop_noops(chain, changes):
+    result = [chain[0]]
+    for index in range(1, len(chain)):
+        node = chain[index]
+        if (isinstance(node, OpNode) and _movable(chain, index) and
+                _is_noop(node)):
+            changes.append(Change("drop", [node], None))
+            continue
+        result.append(node)
+    return result
+
+def _move_crops(chain, changes):
+    chain = list(chain)
+    for index in range(2, len(chain)):
+        node = chain[index]
+        if (not isinstance(node, OpNode) or node.operation != "gegl:crop" or
+                _has_aux(node) or not _movable(chain, index)):
+            continue
+        position = index
+        while position > 1:
+            previous = chain[position - 1]
+            if (not isinstance(previous, OpNode) or
+                    previous.operation not in POINT_OPERATIONS or
+                    _has_aux(previous) or
+                    not _movable(chain, position - 1)):
+                break
+            position -= 1
+        if position < index:
+            changes.append(Change("move", [node], chain[position]))
+            del chain[index]
+            chain.insert(position, node)
+    return chain
+
+def _first(node):
+    while isinstance(node, Graph):
+        node = node._children[0]
+    return node
+
+def _last(node):
+    while isinstance(node, Graph):
+        node = node._children[-1]
+    return node
+
+def _forget_consumer(raw_producer, consumer):
+    if raw_producer is None:
+        return
+    outputs = _consumers(_wrap(raw_producer))
+    for i, item in enumerate(outputs):
+        if item is consumer:
+            del outputs[i]
+            break
+
+def _relink(graph, old, new):
+    # Makes the GEGL connections follow the new chain order
+    kept = set(id(node) for node in new)
+    for node in old:
+        if id(node) in kept:
+            continue
+        _forget_consumer(node._node.get_producer("input", None), node)
+        node._node.disconnect("input")
+        node._pads = {"output": []}
+        graph._node.remove_child(node._node)
+        _parents.pop(hash(node._node), None)
+    added = set(id(node) for node in old)
+    for node in new:
+        if id(node) not in added:
+            graph._add_child(node)
+    for producer, consumer in zip(new, new[1:]):
+        raw_producer = _first(consumer)._node.get_producer("input", None)
+        if raw_producer is _last(producer)._node:
+            continue
+        consumer = _first(consumer)
+        _forget_consumer(raw_producer, consumer)
+        consumer.connect_from(_last(producer))
+    graph._children[:] = new
+
+def optimize(graph):
+    """Rewrites the graph chain so that it does less work for the same output
+
+    - runs of "rotate", "scale-ratio", "translate" and "transform" nodes
+      sharing the same sampler are folded into a single "transform"
+    - nodes doing nothing are dropped: "nop", "opacity" at 1.0,
+      zero radius blurs, identity transforms and crops containing
+      their whole input
+    - crops are moved before the pixel-wise operations
+      (see POINT_OPERATIONS) preceding them
+
+    Only nodes read by nothing but the next node in the chain are
+    touched. Sub-graphs and graphs plugged into aux pads are
+    optimized as well.
+    Returns a list of Change tuples describing what was done.
+    """
+    changes = []
+    _optimize(graph, changes, set())
+    return changes
+
+def _optimize(graph, changes, seen):
+    if id(graph) in seen:
+        return
+    seen.add(id(graph))
+    for child in graph._children:
+        if isinstance(child, Graph):
+            _optimize(child, changes, seen)
+        elif child.has_pad("aux"):
+            producer = child._node.get_producer("aux", None)
+            aux_graph = _parent_of(producer)
+            if isinstance(aux_graph, Graph):
+                _optimize(aux_graph, changes, seen)
+    if len(graph._children) < 2:
+        return
+    old = list(graph._children)
+    new = _fold_affine(old, changes)
+    new = _drop_noops(new, changes)
+    new = _move_crops(new, changes)
+    if [id(node) for node in new] != [id(node) for node in old]:
+        _relink(graph, old, new)
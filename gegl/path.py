@@ -2,8 +2,13 @@
 # Author: João S. O. Bueno
 
 import sys
+import weakref
+from collections import namedtuple
 from gi.repository import Gegl as _gegl
 
+# numpy is optional, and imported by _require_numpy when first needed
+numpy = None
+
 
 """
 Creates facilities to use GEGL's Paths (Vectors)
@@ -12,6 +17,14 @@ filling and other things.
 
 
 """
+
+# Number of points taken by each path command
+_COMMAND_POINTS = {"M": 1, "L": 1, "C": 3, "m": 1, "l": 1, "c": 3,
+                   "z": 0, "Z": 0}
+
+Flattened = namedtuple("Flattened", "points bounds length")
+
+
 class Path(object):
     """
     Wrapper for a GEGL Path object. The string passed
@@ -20,6 +33,9 @@ class Path(object):
     coordinates separated by spaces - ex.: "M 0 0 L 100 100"
     """
     def __init__(self, path=None, *args):
+        from .gegl import _ensure_init
+        _ensure_init()
+        self._arrays = None
         if path is None:
             self._path = _gegl.Path()
         elif isinstance(path, _gegl.Path):
@@ -31,7 +47,132 @@ class Path(object):
             self._path = _gegl.Path.new_from_string(path_str)
         else:
             raise ValueError("Unrecognized parameters for Path")
-        # FIXME: use weakrefs instead:
-        self._path._wrapper = self
+        # The handler only holds a weak reference to this wrapper, and
+        # is disconnected when the wrapper goes away
+        handler = self._path.connect("changed", _forget_arrays,
+                                     weakref.ref(self))
+        finalizer = weakref.finalize(self, self._path.disconnect, handler)
+        finalizer.atexit = False
     # TODO: maintain path subcommands as components so they can
     # be edited as items
+
+    @classmethod
+    def from_arrays(cls, commands, points):
+        """Builds a path from a sequence of commands and an (N, 2) point array
+
+        commands holds one letter per command ("M", "L", "C", ...), either
+        as a string, a sequence or a numpy array of characters or
+        ASCII codes. Each command takes its points, in order, from
+        "points" - 1 for moves and lines, 3 for curves, none for "z":
+        >>> Path.from_arrays("MLL", [(0, 0), (100, 0), (100, 100)])
+
+        The arrays are kept, so to_arrays on the new path is free.
+        """
+        _require_numpy()
+        if isinstance(commands, str):
+            commands = list(commands)
+        commands = numpy.asarray(commands)
+        points = numpy.asarray(points, dtype="float64").reshape(-1, 2)
+        if not len(commands):
+            if len(points):
+                raise ValueError("No commands were given for %d points"
+                                 % len(points))
+            return cls()
+        if commands.dtype.kind in "iu":
+            if ((commands < 0) | (commands > 255)).any():
+                raise ValueError("Unknown path command codes: %s" % ", ".join(
+                    str(code) for code in sorted(set(
+                        commands[(commands < 0) | (commands > 255)].tolist()))))
+            codes = commands.astype("uint8")
+        else:
+            codes = numpy.frombuffer(
+                commands.astype("S1").tobytes(), dtype="uint8")
+        letters = codes.view("S1").astype("U1")
+        counts = _COMMAND_TABLE[codes]
+        if (counts < 0).any():
+            raise ValueError("Unknown path commands: %s" % ", ".join(
+                sorted(set(letters[counts < 0].tolist()))))
+        if counts.sum() != len(points):
+            raise ValueError("These commands take %d points, %d were given"
+                             % (counts.sum(), len(points)))
+        # Lays out letters and coordinates in a single token array,
+        # so that GEGL parses the whole path in one call
+        sizes = 1 + 2 * counts
+        positions = numpy.concatenate([[0], numpy.cumsum(sizes)[:-1]])
+        tokens = numpy.empty(sizes.sum(), dtype=object)
+        is_coordinate = numpy.ones(len(tokens), dtype=bool)
+        is_coordinate[positions] = False
+        tokens[positions] = letters
+        tokens[is_coordinate] = points.ravel().astype(str)
+        self = cls(" ".join(tokens.tolist()))
+        self._arrays = (letters, points.copy())
+        return self
+
+    def to_arrays(self):
+        """Returns the path as (commands, points) arrays
+
+        The inverse of from_arrays: an array with one letter per
+        command and an (N, 2) float array with their points.
+        """
+        _require_numpy()
+        if self._arrays is None:
+            tokens = numpy.array(
+                self._path.to_string().replace(",", " ").split())
+            is_command = numpy.char.isalpha(tokens)
+            letters = tokens[is_command].astype("U1")
+            points = tokens[~is_command].astype("float64").reshape(-1, 2)
+            self._arrays = (letters, points)
+        letters, points = self._arrays
+        return letters.copy(), points.copy()
+
+    @property
+    def length(self):
+        return self._path.get_length()
+
+    @property
+    def bounds(self):
+        """(min_x, min_y, max_x, max_y) of the path"""
+        min_x, max_x, min_y, max_y = self._path.get_bounds()
+        return min_x, min_y, max_x, max_y
+
+    def flatten(self, tolerance=1.0):
+        """Samples points along the path, at most "tolerance" apart
+
+        Returns a (points, bounds, length) named tuple, with points as an
+        (N, 2) float array, and the bounds of the sampled points
+        as (min_x, min_y, max_x, max_y).
+        """
+        _require_numpy()
+        length = self._path.get_length()
+        samples = max(2, int(numpy.ceil(length / tolerance)) + 1)
+        xs, ys = self._path.calc_values(samples)
+        points = numpy.column_stack([numpy.asarray(xs, dtype="float64"),
+                                     numpy.asarray(ys, dtype="float64")])
+        bounds = tuple(points.min(axis=0).tolist() +
+                       points.max(axis=0).tolist())
+        return Flattened(points, bounds, length)
+
+
+def _forget_arrays(native_path, *args):
+    # The native path changed, so arrays cached by from_arrays
+    # or to_arrays are stale
+    wrapper = args[-1]()
+    if wrapper is not None:
+        wrapper._arrays = None
+
+# Number of points taken by each command, indexed by ASCII code
+# (-1 for unknown commands) - built with numpy, when first needed
+_COMMAND_TABLE = None
+
+def _require_numpy():
+    global numpy, _COMMAND_TABLE
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("This feature requires numpy to be installed")
+    if _COMMAND_TABLE is None:
+        table = numpy.full(256, -1, dtype="int64")
+        for letter, count in _COMMAND_POINTS.items():
+            table[ord(letter)] = count
+        _COMMAND_TABLE = table
@@ -0,0 +1,127 @@
+# coding: utf-8
+
+"""
+Reuse of native buffers across renders.
+"""
+
+from .gegl import _bytes_per_pixel, _walk
+from .gegl import Buffer, Rectangle
+from .cache import _LRUCache
+
+
+class BufferPool(_LRUCache):
+    """Hands out Buffers, keeping released ones around to be used again
+
+    >>> pool = gegl.BufferPool(max_bytes=64 * 1024 * 1024)
+    >>> with pool.acquire((0, 0, 512, 512), "RGBA float") as buffer:
+    ...     graph[-1].buffer = buffer
+
+    Idle buffers are kept in buckets by format and extent, and
+    cleared when handed out again. When the idle buffers take more
+    than max_bytes the least recently released ones are dropped.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        _LRUCache.__init__(self, max_bytes)
+        self.in_use_bytes = 0
+        # The idle buffers are the cache entries - keyed on their
+        # native buffer, holding (bucket, Buffer) - and each bucket
+        # lists the keys of its idle buffers
+        self._buckets = {}
+        self._in_use = {}
+
+    def acquire(self, rect, format="RGBA u8"):
+        """Returns a cleared Buffer covering rect
+
+        The buffer should be given back with release - or used
+        in a "with" block, which releases it at the end.
+        """
+        if not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        bucket = (format, rect.as_sequence())
+        size = rect.width * rect.height * _bytes_per_pixel(format)
+        with self._lock:
+            keys = self._buckets.get(bucket)
+            if keys:
+                key = keys.pop()
+                if not keys:
+                    del self._buckets[bucket]
+                self._lookup(key)
+                buffer = self._discard(key)[1]
+            else:
+                self.misses += 1
+                buffer = None
+        if buffer is None:
+            buffer = Buffer(rect, format)
+        else:
+            buffer.buffer.clear(rect.rect)
+        buffer._pool = self
+        with self._lock:
+            self._in_use[hash(buffer.buffer)] = (bucket, buffer, size)
+            self.in_use_bytes += size
+        return buffer
+
+    def release(self, buffer):
+        """Gives back a buffer returned by acquire"""
+        native = buffer.buffer if isinstance(buffer, Buffer) else buffer
+        key = hash(native)
+        with self._lock:
+            try:
+                bucket, buffer, size = self._in_use.pop(key)
+            except KeyError:
+                raise ValueError("Buffer is not in use from this pool")
+            self.in_use_bytes -= size
+            buffer._pool = None
+            self._buckets.setdefault(bucket, []).append(key)
+            self._store(key, (bucket, buffer), size)
+
+    def _evicted(self, key, value):
+        bucket = value[0]
+        keys = self._buckets[bucket]
+        keys.remove(key)
+        if not keys:
+            del self._buckets[bucket]
+
+    def bind(self, graph, rect, format="RGBA u8"):
+        """Sets a buffer from the pool on each "write-buffer" node in graph
+
+        Nodes in sub-graphs and in graphs plugged into aux pads
+        are included. Returns the buffers, in graph order - use
+        unbind to give them back once the results were used.
+        """
+        buffers = []
+        for node in _write_buffer_nodes(graph):
+            buffer = self.acquire(rect, format)
+            node._node.set_property("buffer", buffer.buffer)
+            buffers.append(buffer)
+        return buffers
+
+    def unbind(self, graph):
+        """Takes the buffers set by bind out of graph and releases them"""
+        for node in _write_buffer_nodes(graph):
+            native = node._node.get_property("buffer")
+            if native is not None and hash(native) in self._in_use:
+                node._node.set_property("buffer", None)
+                self.release(native)
+
+    def clear(self):
+        """Drops all idle buffers"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self.bytes = 0
+
+    def stats(self):
+        stats = _LRUCache.stats(self)
+        stats.update({
+            "idle": len(self._entries),
+            "in_use": len(self._in_use),
+            "in_use_bytes": self.in_use_bytes,
+            "occupancy": (float(self.bytes) / self.max_bytes
+                          if self.max_bytes else 0.0),
+        })
+        return stats
+
+
+def _write_buffer_nodes(graph):
+    return [node for node in _walk(graph, set())
+            if node.operation == "gegl:write-buffer"]
@@ -0,0 +1,250 @@
+# coding: utf-8
+
+"""
+Per-node profiling of graph rendering.
+
+GEGL has no per-node timers exposed through introspection, so each
+node is measured by rendering it on its own, after everything upstream
+of it was rendered already, over the area its consumers need from it:
+thanks to GEGL's node caches this approximates the cost of the node
+itself. Tile cache and allocation
+counters come from GEGL's global statistics object.
+"""
+
+import json
+import math
+import time
+
+from .gegl import _gegl, Buffer, Graph, OpNode, Rectangle
+from .gegl import _bytes_per_pixel, _is_infinite, _parent_of, _wrapper_of
+
+
+_STATS = ("tile-cache-hits", "tile-cache-misses", "tile-alloc-total")
+
+def _sample_stats():
+    try:
+        stats = _gegl.stats()
+    except AttributeError:
+        return {}
+    result = {}
+    for name in _STATS:
+        try:
+            result[name] = stats.get_property(name)
+        except TypeError:
+            result[name] = 0
+    return result
+
+def _area(rect):
+    return rect.width * rect.height
+
+def _map_to_producer(rect, consumer, producer):
+    # Approximates the area of producer needed for rect of the consumer
+    # output from their bounding boxes. If one box holds the other (as
+    # for crops, blurs and pixel-wise operations) pixels are taken as
+    # staying in place; otherwise rect is scaled from the consumer box
+    # to the producer box (as for scales and translations).
+    out_box = Rectangle(consumer._node.get_bounding_box())
+    in_box = Rectangle(producer.get_bounding_box())
+    if (_is_infinite(out_box) or _is_infinite(in_box) or
+            out_box.is_empty() or in_box.is_empty() or
+            out_box.contains(in_box) or in_box.contains(out_box)):
+        return rect
+    scale_x = float(in_box.width) / out_box.width
+    scale_y = float(in_box.height) / out_box.height
+    x0 = int(math.floor(in_box.x + (rect.x - out_box.x) * scale_x))
+    y0 = int(math.floor(in_box.y + (rect.y - out_box.y) * scale_y))
+    x1 = int(math.ceil(in_box.x + (rect.x + rect.width - out_box.x) * scale_x))
+    y1 = int(math.ceil(in_box.y + (rect.y + rect.height - out_box.y) * scale_y))
+    return Rectangle(x0, y0, x1 - x0, y1 - y0)
+
+def _requested_rects(nodes, rect):
+    # Walks the nodes from the output up, mapping the area requested from
+    # each node to its producers. Keyed on the native nodes.
+    requested = {}
+    for path, node in reversed(nodes):
+        node_rect = requested.setdefault(hash(node._node), rect)
+        for pad in ("input", "aux"):
+            if not node.has_pad(pad):
+                continue
+            producer = node._node.get_producer(pad, None)
+            if producer is None:
+                continue
+            mapped = _map_to_producer(node_rect, node, producer)
+            if hash(producer) in requested:
+                mapped = requested[hash(producer)].union(mapped)
+            requested[hash(producer)] = mapped
+    return requested
+
+
+class NodeProfile(object):
+    """Measurements for one node - times are in seconds"""
+    def __init__(self, path, node):
+        self.path = path
+        self.node = node
+        self.operation = node.operation
+        self.start = 0.0
+        self.wall_time = 0.0
+        self.requested_area = 0
+        self.computed_area = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.bytes_allocated = 0
+
+    def __repr__(self):
+        return "NodeProfile(%s, %s, %.3fms)" % (
+            self.path, self.operation, self.wall_time * 1000)
+
+
+class ProfileReport(object):
+    """The result of Graph.profile
+
+    "nodes" lists a NodeProfile per node, upstream nodes first.
+    Node paths are indexes into the graph: "2" is graph[2], "1/0" is
+    graph[1][0] for a sub-graph and "3:aux/1" is the second node
+    of the graph plugged into the aux pad of graph[3].
+    """
+    def __init__(self, rect, nodes):
+        self.rect = rect
+        self.nodes = nodes
+
+    @property
+    def total_time(self):
+        return sum(node.wall_time for node in self.nodes)
+
+    def hottest(self, count=5):
+        return sorted(self.nodes, key=lambda n: n.wall_time,
+                      reverse=True)[:count]
+
+    def table(self):
+        """Returns the report formated as a text table"""
+        total = self.total_time or 1.0
+        lines = ["%-12s %-28s %10s %6s %12s %12s %8s %12s" % (
+            "node", "operation", "time (ms)", "%", "requested", "computed",
+            "hits", "bytes")]
+        for node in self.nodes:
+            lines.append("%-12s %-28s %10.3f %6.1f %12d %12d %8d %12d" % (
+                node.path, node.operation, node.wall_time * 1000,
+                100.0 * node.wall_time / total, node.requested_area,
+                node.computed_area, node.cache_hits, node.bytes_allocated))
+        lines.append("%-12s %-28s %10.3f" % ("total", "",
+                                             self.total_time * 1000))
+        return "\n".join(lines)
+
+    def to_chrome_trace(self):
+        """Returns the report in Chrome's trace event format
+
+        The result can be saved with json.dump and loaded
+        in chrome://tracing or Perfetto.
+        """
+        events = []
+        for node in self.nodes:
+            events.append({
+                "name": node.operation,
+                "cat": "gegl",
+                "ph": "X",
+                "ts": node.start * 1e6,
+                "dur": node.wall_time * 1e6,
+                "pid": 0,
+                "tid": node.path.count("/") + node.path.count(":"),
+                "args": {
+                    "path": node.path,
+                    "requested_area": node.requested_area,
+                    "computed_area": node.computed_area,
+                    "cache_hits": node.cache_hits,
+                    "cache_misses": node.cache_misses,
+                    "bytes_allocated": node.bytes_allocated,
+                },
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path):
+        with open(path, "w") as file_:
+            json.dump(self.to_chrome_trace(), file_)
+
+    def __repr__(self):
+        return self.table()
+
+
+def _collect(graph, prefix, result, seen):
+    # Lists (path, OpNode) pairs with producers before their consumers
+    for index, child in enumerate(graph._children):
+        path = "%s%d" % (prefix, index)
+        if isinstance(child, Graph):
+            _collect(child, path + "/", result, seen)
+            continue
+        if child.has_pad("aux"):
+            producer = child._node.get_producer("aux", None)
+            if producer is not None and id(producer) not in seen:
+                aux_graph = _parent_of(producer)
+                if isinstance(aux_graph, Graph):
+                    _collect(aux_graph, path + ":aux/", result, seen)
+                else:
+                    seen.add(id(producer))
+                    result.append((path + ":aux",
+                                   _wrapper_of(producer) or
+                                   OpNode._from_raw_node(producer)))
+        if id(child._node) not in seen:
+            seen.add(id(child._node))
+            result.append((path, child))
+    return result
+
+def profile(graph, rect=None, format="RGBA float"):
+    """Renders graph node by node, measuring each one
+
+    rect defaults to the bounding box of the graph output; it is
+    required if the output is infinite (eg. a "color" source).
+    The area requested from each upstream node is worked out from
+    rect and the bounding boxes of the nodes, so it is only
+    approximate for operations moving pixels around (eg. rotations).
+    Sink nodes, such as "png-save", are timed processing their
+    whole input.
+    """
+    if rect is None:
+        rect = Rectangle(graph._output_node()._node.get_bounding_box())
+        if _is_infinite(rect):
+            raise ValueError("The graph output is infinite - "
+                             "a rect to profile has to be given")
+    elif not isinstance(rect, Rectangle):
+        rect = Rectangle(rect)
+    nodes = _collect(graph, "", [], set())
+    requested = _requested_rects(nodes, rect)
+    # Each node is blitted over the part of its requested area it
+    # has content for, into a scratch buffer allocated (and written to,
+    # so its tiles exist) before any measurement starts.
+    blits = {}
+    scratch_rect = Rectangle(0, 0, 0, 0)
+    for path, node in nodes:
+        if node.has_pad("output"):
+            blit = requested[hash(node._node)].intersection(
+                node._node.get_bounding_box())
+            blits[hash(node._node)] = blit
+            scratch_rect = scratch_rect.union(blit)
+    if not scratch_rect.is_empty():
+        scratch = Buffer(scratch_rect, format)
+        scratch.set(scratch_rect, format, bytes(
+            _area(scratch_rect) * _bytes_per_pixel(format)))
+    profiles = []
+    origin = time.perf_counter()
+    for path, node in nodes:
+        entry = NodeProfile(path, node)
+        before = _sample_stats()
+        entry.start = time.perf_counter() - origin
+        if node.has_pad("output"):
+            blit = blits[hash(node._node)]
+            entry.requested_area = _area(requested[hash(node._node)])
+            entry.computed_area = _area(blit)
+            if not blit.is_empty():
+                node._node.blit_buffer(scratch.buffer, blit.rect, 0,
+                                       _gegl.AbyssPolicy.NONE)
+        else:
+            node._node.process()
+        entry.wall_time = time.perf_counter() - origin - entry.start
+        after = _sample_stats()
+        if before:
+            entry.cache_hits = after["tile-cache-hits"] - before["tile-cache-hits"]
+            entry.cache_misses = (after["tile-cache-misses"] -
+                                  before["tile-cache-misses"])
+            entry.bytes_allocated = max(0, after["tile-alloc-total"] -
+                                        before["tile-alloc-total"])
+        profiles.append(entry)
+    return ProfileReport(rect, profiles)
@@ -0,0 +1,163 @@
+# coding: utf-8
+
+"""
+Multi-resolution previews of a Buffer or a Graph output, computed
+and cached one tile at a time.
+"""
+
+from .gegl import _gegl, _bytes_per_pixel, _is_infinite
+from .gegl import Buffer, Graph, Rectangle
+from .cache import _LRUCache
+
+
+class Pyramid(_LRUCache):
+    """Downscaled levels of a Buffer or Graph output, computed on demand
+
+    Level 0 is the source at full size, level 1 is half the size,
+    level 2 a quarter, and so on:
+    >>> pyramid = gegl.Pyramid(graph, (0, 0, 8192, 8192))
+    >>> data = pyramid.get((0, 0, 1024, 1024), level=3)
+
+    Each level is split in tiles. A tile is computed the first time
+    it is needed, by scaling down the four tiles under it in the
+    level above, and is cached: when the cached tiles take more than
+    max_bytes the least recently used ones are dropped.
+    After the source changes, call invalidate with the changed area.
+    """
+    def __init__(self, source, rect=None, format="RGBA u8", tile_size=256,
+                 max_bytes=128 * 1024 * 1024):
+        if isinstance(source, Buffer):
+            self._buffer = source
+            self._node = None
+            if rect is None:
+                rect = source.get_extent()
+        else:
+            if isinstance(source, Graph):
+                source = source._output_node()
+            self._buffer = None
+            self._node = source
+            if rect is None:
+                rect = Rectangle(source._node.get_bounding_box())
+                if _is_infinite(rect):
+                    raise ValueError("The graph output is infinite - "
+                                     "a rect for the pyramid has to be given")
+        if not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        self.source = source
+        self.rect = rect
+        self.format = format
+        self.tile_size = tile_size
+        _LRUCache.__init__(self, max_bytes)
+        self._generation = 0
+
+    @property
+    def levels(self):
+        """Number of levels, down to the first one fitting in a single tile"""
+        levels = 1
+        size = max(self.rect.width, self.rect.height)
+        while size > self.tile_size:
+            size = -(-size // 2)
+            levels += 1
+        return levels
+
+    def level_rect(self, level):
+        """The area covered by the source, in the coordinates of level"""
+        factor = 1 << level
+        x0, y0 = self.rect.x // factor, self.rect.y // factor
+        x1 = -(-(self.rect.x + self.rect.width) // factor)
+        y1 = -(-(self.rect.y + self.rect.height) // factor)
+        return Rectangle(x0, y0, x1 - x0, y1 - y0)
+
+    def get(self, rect, level=0):
+        """Returns the pixels in rect, given in the coordinates of level
+
+        Just like Graph.render, the result is a bytes object
+        in the pyramid format.
+        """
+        if level < 0:
+            raise ValueError("Pyramid levels start at 0")
+        if not isinstance(rect, Rectangle):
+            rect = Rectangle(rect)
+        if level == 0 and self._buffer is not None:
+            source = self._buffer
+        else:
+            source = self._assemble(rect, level)
+        return source.buffer.get(rect.rect, 1.0, self.format,
+                                 _gegl.AUTO_ROWSTRIDE)
+
+    def _assemble(self, rect, level):
+        # A Buffer with the tiles of level covering rect
+        size = self.tile_size
+        tx0, ty0 = rect.x // size, rect.y // size
+        tx1 = -(-(rect.x + rect.width) // size)
+        ty1 = -(-(rect.y + rect.height) // size)
+        target = Buffer((tx0 * size, ty0 * size,
+                         (tx1 - tx0) * size, (ty1 - ty0) * size), self.format)
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                tile = Rectangle(tx * size, ty * size, size, size)
+                target.buffer.set(tile.rect, self.format,
+                                  self._tile(level, tx, ty))
+        return target
+
+    def _tile(self, level, tx, ty):
+        key = (level, tx, ty)
+        with self._lock:
+            data = self._lookup(key)
+            generation = self._generation
+        if data is not None:
+            return data
+        data = self._compute(level, tx, ty)
+        with self._lock:
+            # a tile computed while its area was invalidated is not kept
+            if generation == self._generation:
+                self._store(key, data, len(data))
+        return data
+
+    def _compute(self, level, tx, ty):
+        size = self.tile_size
+        rect = Rectangle(tx * size, ty * size, size, size)
+        visible = rect.intersection(self.level_rect(level))
+        if visible.is_empty():
+            return bytes(size * size * _bytes_per_pixel(self.format))
+        if level == 0:
+            # Only graph output gets here - buffers are read directly
+            target = Buffer(rect, self.format)
+            self._node._node.blit_buffer(target.buffer, visible.rect, 0,
+                                         _gegl.AbyssPolicy.NONE)
+            return target.buffer.get(rect.rect, 1.0, self.format,
+                                     _gegl.AUTO_ROWSTRIDE)
+        if level == 1 and self._buffer is not None:
+            source = self._buffer
+        else:
+            source = self._assemble(
+                Rectangle(rect.x * 2, rect.y * 2, size * 2, size * 2),
+                level - 1)
+        return source.buffer.get(rect.rect, 0.5, self.format,
+                                 _gegl.AUTO_ROWSTRIDE)
+
+    def invalidate(self, rect=None):
+        """Drops the cached tiles over rect (by default, all of them)
+
+        rect is given in the coordinates of level 0 - the source.
+        """
+        with self._lock:
+            self._generation += 1
+            if rect is None:
+                self._entries.clear()
+                self.bytes = 0
+                return
+            if not isinstance(rect, Rectangle):
+                rect = Rectangle(rect)
+            for key in list(self._entries):
+                level, tx, ty = key
+                # the tile side, in level 0 pixels
+                side = self.tile_size << level
+                tile = Rectangle(tx * side, ty * side, side, side)
+                if not rect.intersection(tile).is_empty():
+                    self._discard(key)
+
+    def __repr__(self):
+        return "Pyramid(%s, %s, levels=%d)" % (self.rect, self.format,
+                                               self.levels)
+
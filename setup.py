@@ -38,12 +38,14 @@ setup(name = 'python-gegl',
       classifiers = [
           'Development Status :: 4 - Beta',
           'Intended Audience :: Developers',
-          'Programming Language :: Python :: 2',
+          'Programming Language :: Python :: 3',
+          'Programming Language :: Python :: 3 :: Only',
           'Topic :: Multimedia :: Graphics',
           'Topic :: Software Development :: Libraries',
           'Topic :: Printing',
           'License :: OSI Approved :: GNU Lesser General Public License v3 or later (LGPLv3+)',
         ],
-      license = "LGPL v3"
+      license = "LGPL v3",
+      python_requires = ">=3.7",
 
       )
@@ -1,7 +1,21 @@
+import gc
+import os
 import random
+import tempfile
 import unittest
+import weakref
 import gegl
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class TestNodes(unittest.TestCase):
     def test_is_available(self):
@@ -126,6 +140,27 @@ class TestNodes(unittest.TestCase):
         self.assertEqual(node.width, 640)
         self.assertEqual(node.height, 480)
 
+    def test_set_unknown_property(self):
+        node = gegl.OpNode("crop")
+        self.assertRaises(ValueError, node.set, width=10, fnord=1)
+
+    def test_enum_property_from_nick(self):
+        node = gegl.OpNode("gaussian-blur")
+        values = node._schema.constraints["filter"]["enum"]
+        node.set(filter="fir")
+        self.assertEqual(int(node.filter), values["fir"])
+        node.filter = "iir"
+        self.assertEqual(int(node.filter), values["iir"])
+        self.assertRaises(ValueError, node.set, filter="fnord")
+
+    def test_numeric_property_clamping(self):
+        node = gegl.OpNode("gaussian-blur")
+        minimum, maximum = node._schema.constraints["std-dev-x"]["range"]
+        node.std_dev_x = minimum - 10
+        self.assertEqual(node.std_dev_x, minimum)
+        node.set(std_dev_x=maximum + 10)
+        self.assertEqual(node.std_dev_x, maximum)
+
     def test_node_equality(self):
         n1 = gegl.OpNode("grid")
         n2 = gegl.OpNode("grid")
@@ -137,6 +172,69 @@ class TestNodes(unittest.TestCase):
         self.assertNotEqual(n1, n2)
 
 
+class TestSchemaRegistry(unittest.TestCase):
+    def test_schema_shared_between_nodes(self):
+        n1 = gegl.OpNode("grid")
+        n2 = gegl.OpNode("grid")
+        self.assertIs(n1._schema, n2._schema)
+        self.assertIs(n1._schema, gegl.schemas["gegl:grid"])
+
+    def test_schema_contents(self):
+        schema = gegl.schemas["gegl:over"]
+        self.assertIn("input", schema.pads)
+        self.assertIn("aux", schema.pads)
+        self.assertIn("output", schema.pads)
+        schema = gegl.schemas["gegl:color"]
+        self.assertEqual(schema.property_names, {"format", "value"})
+        self.assertIsNotNone(schema.codecs["value"])
+
+    def test_save_and_load(self):
+        gegl.schemas["gegl:crop"]
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            gegl.schemas.save(path)
+            registry = gegl.gegl.SchemaRegistry()
+            self.assertTrue(registry.load(path))
+            self.assertIn("gegl:crop", registry)
+            self.assertEqual(registry["gegl:crop"].property_names,
+                             gegl.schemas["gegl:crop"].property_names)
+        finally:
+            os.unlink(path)
+
+    def test_warm(self):
+        registry = gegl.gegl.SchemaRegistry()
+        registry.warm(["gegl:nop", "gegl:crop"])
+        self.assertEqual(len(registry), 2)
+
+
+class TestInitialization(unittest.TestCase):
+    def test_lazy_init(self):
+        import subprocess, sys
+        code = ("import gegl; assert not gegl.gegl._initialized; "
+                "gegl.OpNode('nop'); assert gegl.gegl._initialized")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(subprocess.call([sys.executable, "-c", code],
+                                         cwd=root), 0)
+
+    def test_numpy_not_imported(self):
+        import subprocess, sys
+        code = "import gegl, sys; assert 'numpy' not in sys.modules"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(subprocess.call([sys.executable, "-c", code],
+                                         cwd=root), 0)
+
+    def test_raw_symbols(self):
+        self.assertIs(gegl.gegl.Node, gegl.gegl._gegl.Node)
+        self.assertIn("Node", dir(gegl.gegl))
+        self.assertRaises(AttributeError, getattr, gegl.gegl, "TileCallback")
+        self.assertRaises(AttributeError, getattr, gegl.gegl, "fnord")
+
+    def test_init_config(self):
+        gegl.init(threads=2)
+        self.assertEqual(gegl.gegl._gegl.config().get_property("threads"), 2)
+
+
 class TestGraph(unittest.TestCase):
 
     def test_can_instantiate_from_string(self):
@@ -208,6 +306,199 @@ class TestGraph(unittest.TestCase):
         g4.plug_as_aux(g2[2])
         self.assertEqual(repr(g1), result)
 
+    def test_render_region(self):
+        graph = gegl.Graph(("color", {"value": (0, 0, 1, 1)}), "png-save")
+        data = graph.render((100, 100, 16, 8))
+        self.assertEqual(len(data), 16 * 8 * 4)
+        self.assertEqual(bytearray(data[:4]), bytearray((0, 0, 255, 255)))
+
+    def test_render_scaled(self):
+        graph = gegl.Graph(("color", {"value": (0, 0, 1, 1)}))
+        data = graph.render((0, 0, 32, 32), scale=0.5)
+        self.assertEqual(len(data), 32 * 32 * 4)
+        self.assertEqual(bytearray(data[:4]), bytearray((0, 0, 255, 255)))
+        data = graph.render((0, 0, 8, 8), scale=0.125)
+        self.assertEqual(data, bytes((0, 0, 255, 255)) * 8 * 8)
+
+    def test_level_for_scale(self):
+        level = gegl.gegl._level_for_scale
+        self.assertEqual([level(scale) for scale in (1, 0.5, 0.25, 0.125)],
+                         [0, 1, 2, 3])
+        self.assertEqual(level(0.3), 0)
+        self.assertEqual(level(2), 0)
+
+    def test_render_parallel(self):
+        graph = gegl.Graph("grid", ("rotate", {"degrees": 30}))
+        rect = (5, 5, 200, 150)
+        buffer = graph.render_parallel(rect, threads=4)
+        self.assertIsInstance(buffer, gegl.Buffer)
+        self.assertEqual(buffer.get_extent().as_sequence(), rect)
+        self.assertEqual(buffer.get(), graph.render(rect))
+        buffer = graph.render_parallel(rect, tiles=(64, 64), threads=3)
+        self.assertEqual(buffer.get(), graph.render(rect))
+        rect = (0, 0, 50, 2)
+        buffer = graph.render_parallel(rect, threads=8)
+        self.assertEqual(buffer.get(), graph.render(rect))
+        buffer = graph.render_parallel((0, 0, 50, 0), threads=8)
+        self.assertEqual(buffer.get_extent().height, 0)
+
+    def test_compile(self):
+        graph = gegl.Graph("color", ("crop", {"width": 4, "height": 4}),
+                           "rotate", "png-save")
+        tpl = graph.compile(params={"angle": (2, "degrees"),
+                                    "fill": (0, "value")})
+        self.assertEqual(tpl.params, ["angle", "fill"])
+        tpl.bind(angle=30, fill=(0, 1, 0, 1))
+        self.assertEqual(graph[2].degrees, 30)
+        self.assertEqual(graph[0].value, (0, 1, 0, 1))
+        self.assertRaises(KeyError, graph.compile, {"x": (0, "fnord")})
+
+    def test_compile_subgraph(self):
+        graph = gegl.Graph("color", gegl.Graph("over", "rotate"))
+        tpl = graph.compile(params={"angle": ((1, 1), "degrees")})
+        tpl.bind(angle=45)
+        self.assertEqual(graph[1][1].degrees, 45)
+
+    def test_processor(self):
+        graph = gegl.Graph("grid", ("rotate", {"degrees": 20}))
+        processor = gegl.Processor(graph, (0, 0, 512, 512))
+        self.assertFalse(processor.is_done)
+        progress = processor.work()
+        self.assertTrue(0 <= progress <= 1)
+        processor.run()
+        self.assertTrue(processor.is_done)
+        self.assertEqual(processor.progress, 1.0)
+        processor.rect = (512, 0, 256, 256)
+        self.assertFalse(processor.is_done)
+        processor.work(budget_ms=1000)
+        self.assertTrue(processor.is_done)
+        self.assertIsInstance(processor.get_buffer(), gegl.Buffer)
+
+    def test_process_async(self):
+        import asyncio
+        fd, path = tempfile.mkstemp(suffix=".png")
+        os.close(fd)
+        os.unlink(path)
+        graph = gegl.Graph(("color", {"value": (1, 0, 0, 1)}),
+                           ("crop", {"width": 300, "height": 300}),
+                           ("png-save", {"path": path}))
+        steps = []
+        asyncio.run(graph.process_async(step_budget_ms=1,
+                                        progress=steps.append))
+        self.assertEqual(steps[-1], 1.0)
+        self.assertTrue(os.path.exists(path))
+        os.unlink(path)
+
+    def test_process_async_cancel(self):
+        import asyncio
+        graph = gegl.Graph("grid", ("crop", {"width": 4000, "height": 4000}),
+                           "nop")
+
+        async def run():
+            task = asyncio.ensure_future(graph.process_async(
+                step_budget_ms=1))
+            await asyncio.sleep(0)
+            task.cancel()
+            await task
+
+        self.assertRaises(asyncio.CancelledError, asyncio.run, run())
+
+    def test_profile(self):
+        graph = gegl.Graph("color", "over", ("gaussian-blur",
+                                             {"std-dev-x": 2}), "nop")
+        gegl.Graph("grid", "rotate").plug_as_aux(graph[1])
+        report = graph.profile((0, 0, 64, 64))
+        paths = [node.path for node in report.nodes]
+        self.assertEqual(paths, ["0", "1:aux/0", "1:aux/1", "1", "2", "3"])
+        self.assertEqual(report.nodes[2].operation, "gegl:rotate")
+        self.assertEqual(report.nodes[4].requested_area, 64 * 64)
+        self.assertIn("gegl:gaussian-blur", report.table())
+        trace = report.to_chrome_trace()
+        self.assertEqual(len(trace["traceEvents"]), 6)
+        self.assertRaises(ValueError, gegl.Graph("color").profile)
+
+    def test_profile_maps_requested_area(self):
+        graph = gegl.Graph("color", ("crop", {"width": 64, "height": 64}),
+                           ("translate", {"x": 100}))
+        report = graph.profile((100, 0, 64, 64))
+        self.assertEqual(report.nodes[1].operation, "gegl:crop")
+        self.assertEqual(report.nodes[1].computed_area, 64 * 64)
+
+    def test_rebuild_from_xml(self):
+        graph = gegl.Graph("grid", "over", "png-save")
+        graph[0].x = 7
+        gegl.Graph("rectangle", "rotate").plug_as_aux(graph[1])
+        copy = gegl.Graph._from_xml(graph.to_xml())
+        self.assertEqual(len(copy), 3)
+        self.assertEqual(copy[0], graph[0])
+        self.assertEqual(copy[0].x, 7)
+        self.assertEqual(copy.to_xml(), graph.to_xml())
+
+    def test_from_xml_cache(self):
+        graph = gegl.Graph(("color", {"value": (1, 0, 0, 1)}), "over",
+                           ("crop", {"width": 10, "height": 10}))
+        gegl.Graph("rectangle", "rotate").plug_as_aux(graph[1])
+        xml = graph.to_xml()
+        gegl.gegl._xml_templates.clear()
+        g1 = gegl.Graph.from_xml(xml)
+        self.assertEqual(len(gegl.gegl._xml_templates), 1)
+        g2 = gegl.Graph.from_xml(xml)
+        self.assertIsNot(g1[0]._node, g2[0]._node)
+        self.assertEqual(g2.to_xml(), xml)
+        self.assertEqual(repr(g2), repr(graph))
+        # clones don't share colors
+        g2[0].value = (0, 1, 0, 1)
+        self.assertEqual(g1[0].value, (1, 0, 0, 1))
+
+    def test_map_threads(self):
+        graph = gegl.Graph(("color", {"value": (1, 0, 0, 1)}),
+                           ("crop", {"width": 8, "height": 8}),
+                           "png-save")
+        directory = tempfile.mkdtemp()
+        paths = [os.path.join(directory, "%d.png" % i) for i in range(6)]
+        params = [{2: {"path": path}} for path in paths]
+        params.insert(3, {2: {"fnord": 1}})
+        results = list(graph.map(params, workers=2, mode="thread"))
+        self.assertEqual([index for index, result in results],
+                         list(range(7)))
+        self.assertIsInstance(results[3][1], ValueError)
+        for path in paths:
+            self.assertTrue(os.path.exists(path))
+            os.unlink(path)
+        os.rmdir(directory)
+
+    def test_map_processes(self):
+        # workers are fresh interpreters, whose first GEGL call is from_xml
+        graph = gegl.Graph(("color", {"value": (1, 1, 1, 1)}),
+                           ("opacity", {"value": 1.0}))
+        params = [{1: {"value": value}} for value in (1.0, 0.0)]
+        results = dict(graph.map(params, workers=2, mode="process",
+                                 rect=(0, 0, 2, 2)))
+        self.assertEqual(results[0], b"\xff" * 16)
+        self.assertEqual(results[1], b"\x00" * 16)
+
+    def test_map_render(self):
+        graph = gegl.Graph(("color", {"value": (1, 1, 1, 1)}),
+                           ("opacity", {"value": 1.0}))
+        params = [{1: {"value": value}} for value in (1.0, 0.0)]
+        results = dict(graph.map(params, workers=2, mode="thread",
+                                 rect=(0, 0, 2, 2)))
+        self.assertEqual(results[0], b"\xff" * 16)
+        self.assertEqual(results[1], b"\x00" * 16)
+
+    def test_map_items_dont_share_properties(self):
+        graph = gegl.Graph(("color", {"value": (1, 1, 1, 1)}),
+                           ("opacity", {"value": 1.0}))
+        params = [{1: {"value": 0.0}}, {}]
+        results = dict(graph.map(params, workers=1, mode="thread",
+                                 rect=(0, 0, 2, 2)))
+        self.assertEqual(results[0], b"\x00" * 16)
+        self.assertEqual(results[1], b"\xff" * 16)
+
+    def test_map_rejects_sub_graphs(self):
+        graph = gegl.Graph("color", gegl.Graph("invert"))
+        self.assertRaises(ValueError, next, graph.map([{}], mode="thread"))
+
     def test_embeded_representation(self):
         g2 = gegl.Graph("crop")
         g1 = gegl.Graph("color", g2, "sdl-display")
@@ -215,6 +506,227 @@ class TestGraph(unittest.TestCase):
             "Graph(0:gegl:color, 1:Graph(0:gegl:crop), 2:gegl:sdl-display)")
         
 
+class TestRenderCache(unittest.TestCase):
+    def test_fingerprint(self):
+        fingerprint = gegl.cache.fingerprint
+        g1 = gegl.Graph("grid", ("rotate", {"degrees": 10}))
+        g2 = gegl.Graph("grid", ("rotate", {"degrees": 10}))
+        self.assertEqual(fingerprint(g1), fingerprint(g2))
+        g2[0].x = 3
+        self.assertNotEqual(fingerprint(g1), fingerprint(g2))
+
+    def test_hits_and_misses(self):
+        cache = gegl.RenderCache()
+        graph = gegl.Graph(("color", {"value": (1, 0, 0, 1)}))
+        b1 = cache.render(graph, (0, 0, 16, 16))
+        b2 = cache.render(gegl.Graph(("color", {"value": (1, 0, 0, 1)})),
+                          (0, 0, 16, 16))
+        self.assertIs(b1, b2)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.render(graph, (0, 0, 16, 16), scale=0.5)
+        self.assertEqual(cache.misses, 2)
+
+    def test_buffer_sources_not_cached(self):
+        cache = gegl.RenderCache()
+        source = gegl.Buffer((0, 0, 4, 4))
+        graph = gegl.Graph(("buffer-source", {"buffer": source}))
+        cache.render(graph, (0, 0, 4, 4))
+        source.set(src=b"\xff" * 4 * 4 * 4)
+        self.assertEqual(cache.render(graph, (0, 0, 4, 4)).get(),
+                         b"\xff" * 4 * 4 * 4)
+        self.assertEqual(len(cache), 0)
+
+    def test_eviction(self):
+        cache = gegl.RenderCache(max_bytes=2 * 16 * 16 * 4)
+        graph = gegl.Graph("color")
+        for x in range(3):
+            cache.render(graph, (x * 16, 0, 16, 16))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.stats()["bytes"], 2 * 16 * 16 * 4)
+
+
+class TestBufferPool(unittest.TestCase):
+    def test_reuse(self):
+        pool = gegl.BufferPool()
+        buffer = pool.acquire((0, 0, 32, 32), "RGBA u8")
+        buffer.set(src=b"\xff" * 32 * 32 * 4)
+        pool.release(buffer)
+        again = pool.acquire((0, 0, 32, 32), "RGBA u8")
+        self.assertIs(again, buffer)
+        self.assertEqual(again.get(), b"\x00" * 32 * 32 * 4)
+        other = pool.acquire((0, 0, 32, 32), "RGBA float")
+        self.assertIsNot(other, buffer)
+        stats = pool.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+        self.assertEqual(stats["in_use"], 2)
+
+    def test_context_manager(self):
+        pool = gegl.BufferPool()
+        with pool.acquire((0, 0, 16, 16)) as buffer:
+            self.assertEqual(pool.stats()["in_use"], 1)
+        self.assertEqual(pool.stats()["in_use"], 0)
+        self.assertEqual(len(pool), 1)
+        self.assertRaises(ValueError, pool.release, buffer)
+
+    def test_trim(self):
+        pool = gegl.BufferPool(max_bytes=16 * 16 * 4 * 2)
+        buffers = [pool.acquire((0, 0, 16, 16)) for i in range(3)]
+        for buffer in buffers:
+            pool.release(buffer)
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(pool.stats()["evictions"], 1)
+        self.assertIs(pool.acquire((0, 0, 16, 16)), buffers[2])
+
+    def test_bind_write_buffer(self):
+        pool = gegl.BufferPool()
+        graph = gegl.Graph(("color", {"value": (1, 1, 1, 1)}),
+                           ("crop", {"width": 8, "height": 8}),
+                           "write-buffer")
+        buffer, = pool.bind(graph, (0, 0, 8, 8))
+        graph()
+        self.assertEqual(buffer.get(), b"\xff" * 8 * 8 * 4)
+        pool.unbind(graph)
+        self.assertEqual(pool.stats()["in_use"], 0)
+        self.assertIsNone(graph[-1]._node.get_property("buffer"))
+
+
+class TestShare(unittest.TestCase):
+    def test_share_identical_chains(self):
+        g1 = gegl.Graph(("color", {"value": (1, 0, 0, 1)}),
+                        ("crop", {"width": 16, "height": 16}), "invert")
+        g2 = gegl.Graph(("color", {"value": (1, 0, 0, 1)}),
+                        ("crop", {"width": 16, "height": 16}), "threshold")
+        merged = gegl.share([g1, g2])
+        self.assertIs(g2[2]._node.get_producer("input", None), g1[1]._node)
+        self.assertIn(g2[2], g1[1].output)
+        self.assertNotIn(g2[2], g2[1].output)
+        self.assertTrue(any(duplicate is g2[1] and shared is g1[1]
+                            for duplicate, shared in merged))
+        self.assertEqual(len(g2.render((0, 0, 16, 16))), 16 * 16 * 4)
+
+    def test_different_chains_are_kept(self):
+        g1 = gegl.Graph(("color", {"value": (1, 0, 0, 1)}), "invert")
+        g2 = gegl.Graph(("color", {"value": (0, 1, 0, 1)}), "invert")
+        self.assertEqual(gegl.share([g1, g2]), [])
+        self.assertIs(g2[1]._node.get_producer("input", None), g2[0]._node)
+
+    def test_share_aux_branches(self):
+        g1 = gegl.Graph("color", "over")
+        gegl.Graph("grid", "rotate").plug_as_aux(g1[1])
+        g2 = gegl.Graph("color", "over")
+        gegl.Graph("grid", "rotate").plug_as_aux(g2[1])
+        gegl.share([g1, g2])
+        self.assertIs(g2[1]._node.get_producer("aux", None),
+                      g1[1]._node.get_producer("aux", None))
+
+
+class TestOptimize(unittest.TestCase):
+    def test_fold_affine_chain(self):
+        graph = gegl.Graph("checkerboard", ("rotate", {"degrees": 30}),
+                           ("scale-ratio", {"x": 2, "y": 2}),
+                           ("translate", {"x": 10, "y": 5}),
+                           ("crop", {"width": 64, "height": 64}))
+        changes = graph.optimize()
+        self.assertEqual([change.action for change in changes], ["fold"])
+        self.assertEqual(len(changes[0].nodes), 3)
+        self.assertEqual(len(graph), 3)
+        self.assertEqual(graph[1].operation, "gegl:transform")
+        self.assertEqual(len(graph.render((0, 0, 64, 64))), 64 * 64 * 4)
+
+    def test_fold_needs_default_abyss_policy(self):
+        scale = gegl.OpNode("scale-ratio", x=2, y=2)
+        if "abyss-policy" not in scale.properties:
+            self.skipTest("scale-ratio has no abyss-policy")
+        scale.abyss_policy = "clamp"
+        graph = gegl.Graph("checkerboard", ("rotate", {"degrees": 30}),
+                           scale, ("translate", {"x": 10, "y": 5}))
+        self.assertEqual(graph.optimize(), [])
+        self.assertEqual(len(graph), 4)
+
+    def test_drop_noops(self):
+        graph = gegl.Graph(("color", {"value": (1, 0, 0, 1)}), "nop",
+                           ("opacity", {"value": 1.0}),
+                           ("gaussian-blur", {"std_dev_x": 0, "std_dev_y": 0}),
+                           ("crop", {"width": 16, "height": 16}), "invert")
+        changes = graph.optimize()
+        self.assertEqual(len(changes), 3)
+        self.assertEqual([child.operation for child in graph],
+                         ["gegl:color", "gegl:crop", "gegl:invert"])
+        self.assertIs(graph[1]._node.get_producer("input", None),
+                      graph[0]._node)
+
+    def test_move_crop_before_point_operations(self):
+        graph = gegl.Graph("checkerboard", "invert", "threshold",
+                           ("crop", {"width": 16, "height": 16}))
+        expected = graph.render((0, 0, 16, 16))
+        changes = graph.optimize()
+        self.assertEqual([change.action for change in changes], ["move"])
+        self.assertEqual([child.operation for child in graph],
+                         ["gegl:checkerboard", "gegl:crop", "gegl:invert",
+                          "gegl:threshold"])
+        self.assertEqual(graph.render((0, 0, 16, 16)), expected)
+
+    def test_nodes_with_other_consumers_are_kept(self):
+        graph = gegl.Graph("checkerboard", "nop", "invert")
+        other = gegl.Graph("over")
+        graph[1].connect_to(other[0], input="aux")
+        self.assertEqual(graph.optimize(), [])
+        self.assertEqual(len(graph), 3)
+
+
+class TestLeaks(unittest.TestCase):
+    def build_and_drop(self, count):
+        for i in range(count):
+            graph = gegl.Graph(("color", {"value": (1, 0, 0, 1)}),
+                               ("crop", {"width": 4, "height": 4}),
+                               "invert")
+            gegl.Graph("grid", "rotate").plug_as_aux(graph[1])
+
+    def test_node_freed_without_collector(self):
+        node = gegl.OpNode("invert")
+        ref = weakref.ref(node)
+        del node
+        self.assertIsNone(ref())
+
+    def test_path_freed_without_collector(self):
+        path = gegl.Path("M 0 0 L 10 10")
+        ref = weakref.ref(path)
+        del path
+        self.assertIsNone(ref())
+
+    def test_close(self):
+        with gegl.Graph("color", "invert", gegl.Graph("threshold")) as graph:
+            ref = weakref.ref(graph[1])
+            parent = graph[1]._parent_graph
+        self.assertIs(parent, graph)
+        self.assertEqual(len(graph), 0)
+        self.assertIsNone(ref())
+
+    def test_inline_aux_graph_is_kept(self):
+        graph = gegl.Graph("color", "over", "nop")
+        gegl.Graph("grid", "rotate").plug_as_aux(graph[1])
+        gc.collect()
+        self.assertIsInstance(graph[1]._pads["aux"], gegl.Graph)
+        template = graph._template()
+        self.assertIsNotNone(template[1][3])
+        report = graph.profile((0, 0, 16, 16))
+        self.assertEqual([node.path for node in report.nodes],
+                         ["0", "1:aux/0", "1:aux/1", "1", "2"])
+        clone = gegl.Graph._from_raw_chain(graph[-1]._node)
+        gc.collect()
+        self.assertIn("\t0 - Graph(0:gegl:grid, 1:gegl:rotate)", repr(clone))
+
+    @unittest.skipIf(resource is None, "needs the resource module")
+    def test_dropped_graphs_keep_memory_flat(self):
+        self.build_and_drop(10000)
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.build_and_drop(100000)
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is given in KiB on Linux
+        self.assertLess(after - before, 32 * 1024)
+
+
 class TestColor(unittest.TestCase):
 
     def test_default(self):
@@ -265,6 +777,58 @@ class TestColor(unittest.TestCase):
         color = gegl.Color(0, 0, 0, 1)
         self.assertEqual(color, (0,0,0,1))
 
+    def test_native_color_created_on_demand(self):
+        color = gegl.Color(0, 0.5, 0, 1)
+        self.assertIsNone(color._native)
+        self.assertEqual(color._color.get_rgba(), (0, 0.5, 0, 1))
+        color.r = 1
+        self.assertEqual(color._color.get_rgba(), (1, 0.5, 0, 1))
+
+    def test_wrapped_native_color_is_live(self):
+        node = gegl.OpNode("color", value=(1, 0, 0, 1))
+        first, second = node.value, node.value
+        first.g = 1
+        self.assertEqual(second, (1, 1, 0, 1))
+        node._node.get_property("value").set_rgba(0, 0, 1, 1)
+        self.assertEqual(first.b, 1)
+
+    def test_parsed_strings_are_cached(self):
+        gegl.gegl._color_cache.clear()
+        gegl.Color("#ff0000")
+        self.assertIn("#ff0000", gegl.gegl._color_cache)
+        self.assertEqual(gegl.Color("#ff0000"), (1, 0, 0, 1))
+
+
+@unittest.skipIf(numpy is None, "numpy not installed")
+class TestColorArray(unittest.TestCase):
+    def test_build(self):
+        colors = gegl.ColorArray(["#ff0000", (0, 0.5, 0),
+                                  gegl.Color(0, 0, 1, 0.5)])
+        self.assertEqual(colors.data.shape, (3, 4))
+        self.assertEqual(colors[1], (0, 0.5, 0, 1))
+        self.assertEqual(colors[2].a, 0.5)
+
+    def test_formats(self):
+        colors = gegl.ColorArray([(1, 0, 0, 1), (0.2, 0.2, 0.2, 0.5)])
+        pixels = colors.to_format("R'G'B'A u8")
+        self.assertEqual(pixels.dtype, numpy.uint8)
+        self.assertEqual(pixels.tolist()[0], [255, 0, 0, 255])
+        premultiplied = colors.to_format("RaGaBaA float")
+        self.assertAlmostEqual(float(premultiplied[1, 0]), 0.1, places=6)
+        for format in ("R'G'B'A u8", "RaGaBaA float", "cairo-ARGB32"):
+            back = gegl.ColorArray.from_format(colors.to_format(format),
+                                               format)
+            self.assertTrue(numpy.allclose(back.data, colors.data,
+                                           atol=0.01))
+
+    def test_matches_gegl_parsing(self):
+        buffer = gegl.Buffer((0, 0, 1, 1), "R'G'B'A u8")
+        gegl.Graph(("color", {"value": "#336699"}),
+                   ("write-buffer", {"buffer": buffer}))()
+        pixels = gegl.ColorArray(["#336699"]).to_format("R'G'B'A u8")
+        self.assertEqual(bytearray(buffer.get()),
+                         bytearray(pixels.tobytes()))
+
 
 class TestRectangle(unittest.TestCase):
     def test_default_parameters(self):
@@ -312,6 +876,89 @@ class TestRectangle(unittest.TestCase):
         self.assertEqual(r.width, 30)
         self.assertEqual(r.height, 30)
 
+    def test_native_created_on_demand(self):
+        r = gegl.Rectangle(1, 2, 3, 4)
+        self.assertIsNone(r._rect)
+        self.assertEqual((r.rect.x, r.rect.height), (1, 4))
+        r.width = 30
+        self.assertEqual(r.rect.width, 30)
+        self.assertRaises(AttributeError, setattr, r, "fnord", 1)
+
+    def test_equality(self):
+        self.assertEqual(gegl.Rectangle(1, 2, 3, 4), (1, 2, 3, 4))
+        self.assertEqual(gegl.Rectangle(1, 2, 3, 4),
+                         gegl.Rectangle((1, 2, 3, 4)))
+        self.assertNotEqual(gegl.Rectangle(1, 2, 3, 4),
+                            gegl.Rectangle(1, 2, 3, 5))
+
+    def test_hashable(self):
+        rects = {gegl.Rectangle(1, 2, 3, 4), gegl.Rectangle(1, 2, 3, 4)}
+        self.assertEqual(len(rects), 1)
+
+    def test_native_rectangle_is_live(self):
+        native = gegl.gegl._gegl.Rectangle()
+        r = gegl.Rectangle(native)
+        native.width = 30
+        self.assertEqual(r.width, 30)
+        r.x = 5.0
+        self.assertEqual(native.x, 5)
+        self.assertIsInstance(r.x, int)
+
+    def test_intersection(self):
+        r1 = gegl.Rectangle(0, 0, 10, 10)
+        self.assertEqual(r1.intersection((5, 5, 10, 10)), (5, 5, 5, 5))
+        self.assertTrue(r1.intersection((20, 0, 5, 5)).is_empty())
+        self.assertFalse(r1.is_empty())
+
+    def test_union_and_contains(self):
+        r1 = gegl.Rectangle(0, 0, 10, 10)
+        self.assertEqual(r1.union((5, 5, 10, 10)), (0, 0, 15, 15))
+        self.assertEqual(r1.union((50, 50, 0, 0)), r1)
+        self.assertEqual(gegl.Rectangle(0, 0, 0, 0).union(r1), r1)
+        self.assertTrue(r1.contains((2, 2, 8, 8)))
+        self.assertFalse(r1.contains((5, 5, 10, 10)))
+
+
+@unittest.skipIf(numpy is None, "numpy not installed")
+class TestRectangleArray(unittest.TestCase):
+    def test_conversions(self):
+        rects = gegl.RectangleArray([gegl.Rectangle(0, 0, 10, 10),
+                                     (5, 5, 10, 10),
+                                     gegl.Rectangle(1, 1, 2, 2).rect])
+        self.assertEqual(len(rects), 3)
+        self.assertEqual(rects[1], gegl.Rectangle(5, 5, 10, 10))
+        self.assertEqual([r.width for r in rects], [10, 10, 2])
+        self.assertEqual(rects.to_native()[2].x, 1)
+
+    def test_intersect_and_contains(self):
+        rects = gegl.RectangleArray([(0, 0, 10, 10), (5, 5, 10, 10),
+                                     (20, 20, 5, 5)])
+        result = rects.intersect((0, 0, 8, 8))
+        self.assertEqual(result.data.tolist(),
+                         [[0, 0, 8, 8], [5, 5, 3, 3], [20, 20, 0, 0]])
+        self.assertEqual(rects.contains((6, 6, 2, 2)).tolist(),
+                         [True, True, False])
+
+    def test_union_and_bounding_box(self):
+        rects = gegl.RectangleArray([(0, 0, 10, 10), (5, 5, 0, 0)])
+        self.assertEqual(rects.union((20, 20, 5, 5)).data.tolist(),
+                         [[0, 0, 25, 25], [20, 20, 5, 5]])
+        self.assertEqual(rects.bounding_box(), (0, 0, 10, 10))
+
+    def test_align(self):
+        rects = gegl.RectangleArray([(10, 10, 100, 20)])
+        self.assertEqual(rects.align(64).data.tolist(), [[0, 0, 128, 64]])
+        self.assertEqual(rects.align(32, superset=False).data.tolist(),
+                         [[32, 32, 64, 0]])
+
+    def test_coalesce(self):
+        rects = gegl.RectangleArray([(0, 0, 10, 10), (10, 0, 10, 10),
+                                     (0, 10, 20, 10), (50, 50, 1, 1),
+                                     (3, 3, 0, 0)])
+        self.assertEqual(sorted(rects.coalesce().data.tolist()),
+                         [[0, 0, 20, 20], [50, 50, 1, 1]])
+
+
 class TestBuffer(unittest.TestCase):
     def test_can_instantiate(self):
         buffer = gegl.Buffer((0,0,320,240))
@@ -330,6 +977,177 @@ class TestBuffer(unittest.TestCase):
         buffer = gegl.Buffer(lbuffer)
         self.assertIs(buffer.buffer, lbuffer)
 
+    def test_create_and_open_file(self):
+        path = os.path.join(tempfile.mkdtemp(), "big.gegl")
+        buffer = gegl.Buffer.create_file(path, (0, 0, 64, 64))
+        self.assertEqual(buffer.get_extent().as_sequence(), (0, 0, 64, 64))
+        buffer.set(src=b"\x80" * 64 * 64 * 4)
+        buffer.buffer.flush()
+        del buffer
+        reopened = gegl.Buffer.open(path)
+        self.assertEqual(reopened.get(), b"\x80" * 64 * 64 * 4)
+
+    def test_from_mmap(self):
+        path = os.path.join(tempfile.mkdtemp(), "raw.rgba")
+        # 16 bytes of header, then 8 rows of 10 pixels padded to 48 bytes
+        rows = [bytes([y]) * 40 + b"\x00" * 8 for y in range(8)]
+        with open(path, "wb") as file_:
+            file_.write(b"H" * 16 + b"".join(rows))
+        buffer = gegl.Buffer.from_mmap(path, (0, 0, 10, 8), "RGBA u8",
+                                       offset=16, rowstride=48)
+        self.assertEqual(buffer.get(), b"".join(row[:40] for row in rows))
+        with open(path, "r+b") as file_:
+            file_.seek(16 + 48 * 2)
+            file_.write(b"\xff" * 40)
+        buffer.invalidate((0, 2, 10, 1))
+        self.assertEqual(buffer.get()[80:120], b"\xff" * 40)
+        buffer.set((0, 0, 10, 1), src=b"\x01" * 40)
+        buffer.flush((0, 0, 10, 1))
+        with open(path, "rb") as file_:
+            self.assertEqual(file_.read()[16:64], b"\x01" * 40 + b"\x00" * 8)
+
+    def test_wrap(self):
+        data = bytearray(8 * 8 * 4)
+        buffer = gegl.Buffer.wrap(data, (0, 0, 8, 8), "RGBA u8")
+        self.assertEqual(buffer.get(), bytes(data))
+        data[:32] = b"\xff" * 32
+        self.assertEqual(buffer.get()[:32], b"\x00" * 32)
+        buffer.invalidate((0, 0, 8, 1))
+        self.assertEqual(buffer.get()[:32], b"\xff" * 32)
+        self.assertRaises(ValueError, gegl.Buffer.wrap, data)
+
+    @unittest.skipIf(numpy is None, "numpy not installed")
+    def test_wrap_array(self):
+        frame = numpy.zeros((6, 5, 4), "uint8")
+        buffer = gegl.Buffer.wrap(frame)
+        self.assertEqual(buffer.get_extent().as_sequence(), (0, 0, 5, 6))
+        self.assertEqual(buffer.format, "RGBA u8")
+        frame[2:4] = 200
+        buffer.invalidate((0, 2, 5, 2))
+        numpy.testing.assert_array_equal(buffer.to_array(), frame)
+        buffer.set((0, 0, 5, 1), src=b"\x07" * 20)
+        buffer.flush()
+        self.assertTrue((frame[0] == 7).all())
+        self.assertRaises(ValueError, gegl.Buffer.wrap, frame[:, ::2])
+
+    @unittest.skipIf(numpy is None, "numpy not installed")
+    def test_wrap_array_slice(self):
+        frame = numpy.zeros((6, 5, 4), "uint8")
+        frame[2:4, 1:3] = 9
+        buffer = gegl.Buffer.wrap(frame[1:5, 1:4])
+        self.assertEqual(buffer.get_extent().as_sequence(), (0, 0, 3, 4))
+        numpy.testing.assert_array_equal(buffer.to_array(), frame[1:5, 1:4])
+        buffer.set((0, 0, 3, 1), src=b"\x07" * 12)
+        buffer.flush((0, 0, 3, 1))
+        self.assertTrue((frame[1, 1:4] == 7).all())
+        self.assertTrue((frame[1, 0] == 0).all() and (frame[1, 4] == 0).all())
+        self.assertRaises(ValueError, gegl.Buffer.wrap, frame[1:5, 1:4],
+                          rowstride=12)
+
+    def test_from_mmap_too_small(self):
+        path = os.path.join(tempfile.mkdtemp(), "raw.rgba")
+        with open(path, "wb") as file_:
+            file_.write(b"\x00" * 100)
+        self.assertRaises(ValueError, gegl.Buffer.from_mmap, path,
+                          (0, 0, 10, 10))
+
+
+@unittest.skipIf(numpy is None, "numpy not installed")
+class TestBufferArrays(unittest.TestCase):
+    def test_format_layout(self):
+        layout = gegl.gegl._format_layout
+        self.assertEqual(layout("RGBA u8"), (4, "uint8"))
+        self.assertEqual(layout("R'G'B' u16"), (3, "uint16"))
+        self.assertEqual(layout("RaGaBaA float"), (4, "float32"))
+        self.assertEqual(layout("Y double"), (1, "float64"))
+        self.assertEqual(layout("CIE Lab alpha float"), (4, "float32"))
+        self.assertRaises(ValueError, layout, "RGBA fnord")
+
+    def test_round_trip(self):
+        arr = numpy.arange(10 * 20 * 4, dtype="uint8").reshape(10, 20, 4)
+        buffer = gegl.Buffer.from_array(arr)
+        self.assertEqual(buffer.format, "RGBA u8")
+        self.assertEqual(buffer.get_extent().as_sequence(), (0, 0, 20, 10))
+        self.assertTrue((buffer.to_array() == arr).all())
+
+    def test_to_array_fills_output(self):
+        arr = numpy.full((10, 10, 4), 7, dtype="uint8")
+        buffer = gegl.Buffer.from_array(arr)
+        out = numpy.zeros((10, 16, 4), dtype="uint8")[:, :10]
+        result = buffer.to_array(out=out)
+        self.assertIs(result, out)
+        self.assertTrue((out == 7).all())
+
+    def test_tiles_cover_extent(self):
+        buffer = gegl.Buffer((10, 0, 300, 200))
+        tiles = [rect.as_sequence() for rect in buffer.tiles((128, 128))]
+        self.assertEqual(tiles[0], (10, 0, 118, 128))
+        self.assertEqual(tiles[-1], (256, 128, 54, 72))
+        self.assertEqual(sum(w * h for x, y, w, h in tiles), 300 * 200)
+
+    def test_iter_tiles_overlap(self):
+        buffer = gegl.Buffer((0, 0, 100, 100))
+        rect, arr = next(buffer.iter_tiles((64, 64), overlap=2))
+        self.assertEqual(rect.as_sequence(), (0, 0, 64, 64))
+        self.assertEqual(arr.shape, (68, 68, 4))
+
+    def test_write_tiles(self):
+        buffer = gegl.Buffer((0, 0, 100, 100))
+        for rect, arr in buffer.write_tiles((64, 64), overlap=1):
+            arr[...] = 255
+        self.assertTrue((buffer.to_array() == 255).all())
+
+    def test_write_tiles_break(self):
+        buffer = gegl.Buffer((0, 0, 100, 100))
+        for rect, arr in buffer.write_tiles((64, 64)):
+            arr[...] = 7
+            break
+        self.assertTrue((buffer.to_array(rect) == 7).all())
+
+    def test_to_array_region(self):
+        buffer = gegl.Buffer((0, 0, 10, 10), "Y float")
+        buffer.set_array(numpy.ones((2, 3), dtype="float32"), (4, 4, 3, 2))
+        region = buffer.to_array((4, 4, 3, 2))
+        self.assertEqual(region.shape, (2, 3, 1))
+        self.assertTrue((region == 1).all())
+
+class TestPyramid(unittest.TestCase):
+    def test_buffer_levels(self):
+        buffer = gegl.Buffer((0, 0, 64, 64))
+        buffer.set(src=b"\x80" * 64 * 64 * 4)
+        pyramid = gegl.Pyramid(buffer, tile_size=16)
+        self.assertEqual(pyramid.levels, 3)
+        self.assertEqual(pyramid.level_rect(2).as_sequence(), (0, 0, 16, 16))
+        self.assertEqual(pyramid.get((0, 0, 32, 32), 1), b"\x80" * 32 * 32 * 4)
+        self.assertEqual(pyramid.get((0, 0, 16, 16), 2), b"\x80" * 16 * 16 * 4)
+        misses = pyramid.stats()["misses"]
+        pyramid.get((0, 0, 16, 16), 2)
+        self.assertEqual(pyramid.stats()["misses"], misses)
+        self.assertGreater(pyramid.stats()["hits"], 0)
+
+    def test_invalidate_region(self):
+        buffer = gegl.Buffer((0, 0, 64, 64))
+        pyramid = gegl.Pyramid(buffer, tile_size=16)
+        pyramid.get((0, 0, 32, 32), 1)
+        self.assertEqual(len(pyramid), 4)
+        buffer.set((0, 0, 32, 32), src=b"\xff" * 32 * 32 * 4)
+        pyramid.invalidate((0, 0, 32, 32))
+        self.assertEqual(len(pyramid), 3)
+        self.assertEqual(pyramid.get((0, 0, 16, 16), 1), b"\xff" * 16 * 16 * 4)
+
+    def test_graph_source_and_memory_cap(self):
+        graph = gegl.Graph(("color", {"value": (1, 1, 1, 1)}),
+                           ("crop", {"width": 64, "height": 64}))
+        pyramid = gegl.Pyramid(graph, tile_size=16,
+                               max_bytes=16 * 16 * 4 * 4)
+        self.assertEqual(pyramid.get((0, 0, 8, 8), 3), b"\xff" * 8 * 8 * 4)
+        self.assertLessEqual(pyramid.bytes, 16 * 16 * 4 * 4)
+        self.assertGreater(pyramid.stats()["evictions"], 0)
+
+    def test_infinite_graph_needs_rect(self):
+        self.assertRaises(ValueError, gegl.Pyramid, gegl.Graph("color"))
+
+
 class TestPath(unittest.TestCase):
     def test_instantiate(self):
         path = gegl.Path()
@@ -356,6 +1174,41 @@ class TestPath(unittest.TestCase):
         self.assertIs(node.d._path, path._path)
 
 
+@unittest.skipIf(numpy is None, "numpy not installed")
+class TestPathArrays(unittest.TestCase):
+    def test_from_arrays(self):
+        points = numpy.array([(0, 0), (100, 0), (100, 100)])
+        path = gegl.Path.from_arrays("MLL", points)
+        self.assertEqual(path._path.get_n_nodes(), 3)
+        self.assertAlmostEqual(path.length, 200, places=3)
+        self.assertRaises(ValueError, gegl.Path.from_arrays, "ML", points)
+        self.assertRaises(ValueError, gegl.Path.from_arrays, "MXL", points)
+        # 332 would wrap around to 76, "L"
+        self.assertRaises(ValueError, gegl.Path.from_arrays,
+                          [77, 332, 76], points)
+
+    def test_from_empty_arrays(self):
+        path = gegl.Path.from_arrays("", [])
+        self.assertEqual(path._path.get_n_nodes(), 0)
+        self.assertRaises(ValueError, gegl.Path.from_arrays, [], [(0, 0)])
+
+    def test_to_arrays(self):
+        path = gegl.Path("M 0 0 L 100 0 C 100 50 50 100 0 100")
+        commands, points = path.to_arrays()
+        self.assertEqual(commands.tolist(), ["M", "L", "C"])
+        self.assertEqual(points.shape, (5, 2))
+        self.assertEqual(points[4].tolist(), [0, 100])
+        copy = gegl.Path.from_arrays(commands, points)
+        self.assertEqual(copy._path.get_n_nodes(), 3)
+
+    def test_flatten(self):
+        path = gegl.Path.from_arrays("ML", [(0, 0), (100, 0)])
+        flat = path.flatten(tolerance=10)
+        self.assertEqual(flat.points.shape, (11, 2))
+        self.assertAlmostEqual(flat.length, 100, places=3)
+        self.assertEqual(flat.bounds, (0, 0, 100, 0))
+
+
 class TestGraphManipulations(unittest.TestCase):
     def test_append_node(self):
         graph = gegl.Graph("color")